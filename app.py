@@ -1,86 +1,74 @@
 import streamlit as st
-import os
-import re
-import csv
-import shutil
-import subprocess
+import time
 import zipfile
-from pathlib import Path
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ocr_pipeline import (
+    CACHE_MAX_MB,
+    CPU_COUNT,
+    LOG_PATH,
+    OUTPUT_DIR,
+    ZIP_PATH,
+    TIMED_STATUSES,
+    OutputNames,
+    RunJournal,
+    cache_evict,
+    ocr_jobs_per_file,
+    open_output_zip,
+    process_file,
+    set_stage_time,
+    stage_summary,
+    write_log,
+    write_metrics,
+)
 
 # ---------------- CONFIG ----------------
 st.set_page_config(page_title="Shipment OCR Renamer", layout="wide")
 
-ID_REGEX = re.compile(r"\bS[A-Z0-9]{6,}\b")
-KEYWORDS_SHIPMENT = ("SHIPMENT NUMBER", "SHIPMENT#", "SHIPMENT NO", "SHIPMENT")
-KEYWORDS_REFERENCE = ("REFERENCES", "REFERENCE", "REF")
-
-BASE_DIR = Path("runtime")
-INPUT_DIR = BASE_DIR / "input"
-OUTPUT_DIR = BASE_DIR / "output"
-TMP_DIR = BASE_DIR / "tmp"
-
-for d in [INPUT_DIR, OUTPUT_DIR, TMP_DIR]:
-    d.mkdir(parents=True, exist_ok=True)
-
-
-# ---------------- HELPERS ----------------
-def normalize_text(s):
-    return s.replace("\u00A0", " ").replace("\t", " ")
-
-
-def score_candidate(line, token):
-    score = 0
-    if any(k in line for k in KEYWORDS_SHIPMENT):
-        score += 100
-    if any(k in line for k in KEYWORDS_REFERENCE):
-        score += 60
-    score += len(token)
-    return score
-
-
-def extract_best_id(text):
-    lines = normalize_text(text).splitlines()
-    candidates = []
-
-    for line in lines:
-        up = line.upper()
-        for m in ID_REGEX.findall(up):
-            candidates.append({
-                "token": m,
-                "line": up,
-                "score": score_candidate(up, m)
-            })
-
-    if not candidates:
-        return None, "UNMATCHED"
-
-    ship = [c for c in candidates if any(k in c["line"] for k in KEYWORDS_SHIPMENT)]
-    if ship:
-        return max(ship, key=lambda x: x["score"])["token"], "SHIPMENT"
-
-    ref = [c for c in candidates if any(k in c["line"] for k in KEYWORDS_REFERENCE)]
-    if ref:
-        return max(ref, key=lambda x: x["score"])["token"], "REFERENCE"
-
-    return max(candidates, key=lambda x: x["score"])["token"], "FALLBACK"
-
-
-def run_ocr(input_pdf, out_pdf, txt_file):
-    cmd = [
-        "ocrmypdf",
-        "--force-ocr",
-        "--sidecar", str(txt_file),
-        str(input_pdf),
-        str(out_pdf)
-    ]
-    subprocess.run(cmd, check=True)
-
 
 # ---------------- UI ----------------
 st.title("📄 Shipment OCR & Auto-Renamer")
 st.markdown("Upload scanned PDFs → OCR → Extract **Shipment/Reference IDs starting with `S`** → Rename automatically")
 
+with st.sidebar:
+    st.header("⚙️ Settings")
+    workers = st.number_input(
+        "Files processed in parallel",
+        min_value=1,
+        max_value=CPU_COUNT,
+        value=min(4, CPU_COUNT),
+        help="Cores are split between parallel files and ocrmypdf's own --jobs"
+    )
+    cache_max_mb = st.number_input(
+        "OCR cache size (MB)",
+        min_value=0,
+        value=CACHE_MAX_MB,
+        help="Previously OCR'd PDFs are reused from runtime/cache; oldest entries are evicted first"
+    )
+    text_first = st.checkbox(
+        "Use existing text layer when possible",
+        value=True,
+        help="Skip OCR for digital PDFs whose text already contains a SHIPMENT or REFERENCE ID"
+    )
+    first_pages = st.number_input(
+        "OCR first pages only (0 = all pages)",
+        min_value=0,
+        value=1,
+        help="Remaining pages are OCR'd only when the first pages give no SHIPMENT or REFERENCE ID"
+    )
+    zip_level = st.slider(
+        "ZIP compression level (0 = store)",
+        min_value=0,
+        max_value=9,
+        value=0,
+        help="PDFs barely shrink when deflated; storing them keeps the ZIP build fast"
+    )
+    resume = st.checkbox(
+        "Resume interrupted run",
+        value=True,
+        help="Skip files already renamed by a previous run that did not finish; untick to start fresh"
+    )
+
 uploaded_files = st.file_uploader(
     "Upload scanned PDF files",
     type=["pdf"],
@@ -92,67 +80,72 @@ if uploaded_files:
 
     if st.button("🚀 Run OCR & Rename"):
         progress = st.progress(0)
-        log_rows = []
-
-        for i, file in enumerate(uploaded_files):
-            try:
-                input_path = INPUT_DIR / file.name
-                with open(input_path, "wb") as f:
-                    f.write(file.getbuffer())
-
-                ocr_pdf = TMP_DIR / f"{input_path.stem}_ocr.pdf"
-                txt_file = TMP_DIR / f"{input_path.stem}.txt"
-
-                run_ocr(input_path, ocr_pdf, txt_file)
-
-                text = txt_file.read_text(errors="ignore")
-                extracted_id, rule = extract_best_id(text)
-
-                if extracted_id:
-                    out_name = f"{extracted_id}.pdf"
-                    status = "OK"
-                else:
-                    out_name = f"UNMATCHED_{file.name}"
-                    status = "UNMATCHED"
-
-                shutil.copy2(ocr_pdf, OUTPUT_DIR / out_name)
-
-                log_rows.append([
-                    datetime.now().isoformat(),
-                    file.name,
-                    extracted_id or "",
-                    rule,
-                    out_name,
-                    status
-                ])
-
-            except Exception as e:
-                shutil.copy2(input_path, OUTPUT_DIR / f"ERROR_{file.name}")
-                log_rows.append([
-                    datetime.now().isoformat(),
-                    file.name,
-                    "",
-                    "ERROR",
-                    f"ERROR_{file.name}",
-                    str(e)
-                ])
-
-            progress.progress((i + 1) / len(uploaded_files))
-
-        # Write CSV log
-        log_path = OUTPUT_DIR / "rename_log.csv"
-        with open(log_path, "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["timestamp", "original_file", "extracted_id", "rule", "output_file", "status"])
-            writer.writerows(log_rows)
-
-        # Zip output
-        zip_path = BASE_DIR / "renamed_pdfs.zip"
-        with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-            for file in OUTPUT_DIR.iterdir():
-                zipf.write(file, file.name)
+
+        jobs = ocr_jobs_per_file(workers)
+        journal = RunJournal(resume=resume)
+        run_start = time.perf_counter()
+        results = [None] * len(uploaded_files)
+        done = 0
+        outputs = OutputNames()
+
+        with open_output_zip(ZIP_PATH, zip_level) as zipf:
+            # Each worker mostly waits on its own ocrmypdf subprocess, so threads are enough
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                try:
+                    futures = {
+                        pool.submit(
+                            process_file, file.name, file.getbuffer(), jobs, text_first, first_pages,
+                            journal, outputs, cache_max_mb
+                        ): i
+                        for i, file in enumerate(uploaded_files)
+                    }
+                    for future in as_completed(futures):
+                        row = future.result()
+                        results[futures[future]] = row
+
+                        # Add each output as soon as it exists; only this run's files go in,
+                        # and OutputNames gave each of them its own name
+                        out_name = row[4]
+                        zip_start = time.perf_counter()
+                        zipf.write(OUTPUT_DIR / out_name, out_name)
+                        set_stage_time(row, "zip", time.perf_counter() - zip_start)
+
+                        done += 1
+                        progress.progress(done / len(uploaded_files))
+                except BaseException:
+                    # A rerun or stop raises here: only the files already running
+                    # finish, the queued ones are left for the journal to resume
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    raise
+
+            # Results are indexed by upload position, so the log keeps upload order
+            log_rows = results
+
+            write_log(log_rows)
+            zipf.write(LOG_PATH, LOG_PATH.name, compress_type=zipfile.ZIP_DEFLATED)
+
+        # Every file is done, so a later run has nothing to resume
+        journal.complete()
+
+        wall_seconds = time.perf_counter() - run_start
+        write_metrics(log_rows, wall_seconds)
+
+        # Stores already evicted as they went; this applies a lowered cap to the rest
+        cache_evict(cache_max_mb)
+
+        hits = sum(1 for r in log_rows if r[6] == "HIT")
+        misses = sum(1 for r in log_rows if r[6] == "MISS")
+        text_layer = sum(1 for r in log_rows if r[6] == "TEXT")
+        resumed = sum(1 for r in log_rows if r[6] == "RESUMED")
 
         st.success("✅ Processing complete")
+        st.info(f"OCR cache: {hits} hits, {misses} misses; {text_layer} files used their own text layer")
+        if resumed:
+            st.info(f"{resumed} files resumed from the run journal")
+
+        pages = sum(r[7] for r in log_rows if r[6] in TIMED_STATUSES)
+        st.caption(f"{pages} pages in {wall_seconds:.1f}s — {pages / wall_seconds:.2f} pages/s")
+        st.dataframe(stage_summary(log_rows))
 
         st.dataframe(
             {
@@ -160,10 +153,11 @@ if uploaded_files:
                 "Extracted ID": [r[2] for r in log_rows],
                 "Rule Used": [r[3] for r in log_rows],
                 "Status": [r[5] for r in log_rows],
+                "Cache": [r[6] for r in log_rows],
             }
         )
 
-        with open(zip_path, "rb") as f:
+        with open(ZIP_PATH, "rb") as f:
             st.download_button(
                 "⬇️ Download Renamed PDFs (ZIP)",
                 f,
@@ -0,0 +1,134 @@
+"""
+Micro-benchmark: IdExtractor vs the original extract_best_id.
+
+    python bench_extract_id.py [--docs 200] [--lines 2000]
+
+Checks both give identical results on synthetic sidecar texts, then
+times them on the same texts.
+"""
+import argparse
+import random
+import string
+import tempfile
+import time
+from pathlib import Path
+
+from id_extractor import ID_REGEX, KEYWORDS_REFERENCE, KEYWORDS_SHIPMENT, DEFAULT_EXTRACTOR, normalize_text
+
+
+# ---------------- ORIGINAL IMPLEMENTATION ----------------
+def score_candidate(line, token):
+    score = 0
+    if any(k in line for k in KEYWORDS_SHIPMENT):
+        score += 100
+    if any(k in line for k in KEYWORDS_REFERENCE):
+        score += 60
+    score += len(token)
+    return score
+
+
+def legacy_extract_best_id(text):
+    lines = normalize_text(text).splitlines()
+    candidates = []
+
+    for line in lines:
+        up = line.upper()
+        for m in ID_REGEX.findall(up):
+            candidates.append({
+                "token": m,
+                "line": up,
+                "score": score_candidate(up, m)
+            })
+
+    if not candidates:
+        return None, "UNMATCHED"
+
+    ship = [c for c in candidates if any(k in c["line"] for k in KEYWORDS_SHIPMENT)]
+    if ship:
+        return max(ship, key=lambda x: x["score"])["token"], "SHIPMENT"
+
+    ref = [c for c in candidates if any(k in c["line"] for k in KEYWORDS_REFERENCE)]
+    if ref:
+        return max(ref, key=lambda x: x["score"])["token"], "REFERENCE"
+
+    return max(candidates, key=lambda x: x["score"])["token"], "FALLBACK"
+
+
+# ---------------- SYNTHETIC SIDECARS ----------------
+WORDS = ["Invoice", "date", "Total", "weight", "kg", "Carrier", "Shipper", "Prefix",
+         "No", "Port", "Consignee", "pallets", "seal", "Sealed", "Standard"]
+
+
+def random_id(rng):
+    return "S" + "".join(rng.choices(string.ascii_uppercase + string.digits, k=rng.randint(5, 12)))
+
+
+def random_line(rng, id_rate, keyword_rate):
+    parts = rng.choices(WORDS, k=rng.randint(0, 10))
+    if rng.random() < id_rate:
+        parts.insert(rng.randint(0, len(parts)), random_id(rng))
+    if rng.random() < keyword_rate:
+        parts.insert(0, rng.choice(KEYWORDS_SHIPMENT + KEYWORDS_REFERENCE).title())
+    sep = rng.choice([" ", " ", "\t", "\u00A0"])
+    return sep.join(parts)
+
+
+def random_doc(rng, n_lines):
+    # Vary the densities per document so every rule outcome shows up
+    id_rate = rng.choice([0, 0.001, 0.01, 0.05])
+    keyword_rate = rng.choice([0, 0.0005, 0.005, 0.02])
+    lines = [random_line(rng, id_rate, keyword_rate) for _ in range(n_lines)]
+    # Tesseract separates pages with form feeds
+    return "\n".join(l + ("\f" if rng.random() < 0.02 else "") for l in lines)
+
+
+def best_of(fn, docs, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for doc in docs:
+            fn(doc)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--docs", type=int, default=200)
+    parser.add_argument("--lines", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    docs = [random_doc(rng, args.lines) for _ in range(args.docs)]
+
+    mismatches = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for i, doc in enumerate(docs):
+            path = Path(tmp) / f"{i}.txt"
+            path.write_text(doc)
+            expected = legacy_extract_best_id(path.read_text(errors="ignore"))
+            if DEFAULT_EXTRACTOR.extract_file(path) != expected or DEFAULT_EXTRACTOR.extract_text(doc) != legacy_extract_best_id(doc):
+                mismatches += 1
+
+    rules = {}
+    for doc in docs:
+        _, rule = legacy_extract_best_id(doc)
+        rules[rule] = rules.get(rule, 0) + 1
+
+    legacy = best_of(legacy_extract_best_id, docs, args.repeat)
+    engine = best_of(DEFAULT_EXTRACTOR.extract_text, docs, args.repeat)
+
+    print(f"{args.docs} docs x {args.lines} lines, rules: {rules}")
+    print(f"identical results: {args.docs - mismatches}/{args.docs}")
+    print(f"extract_best_id (original): {legacy * 1000 / args.docs:8.2f} ms/doc")
+    print(f"IdExtractor:                {engine * 1000 / args.docs:8.2f} ms/doc")
+    print(f"speed-up:                   {legacy / engine:8.2f}x")
+
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark: per-page OCR latency of each available backend in smo_ocr.
+
+    python bench_ocr_backends.py [scan.pdf] [--pages 10] [--dpi 300]
+
+Uses the given PDF's pages, or synthetic rendered pages with an SMO
+reference when no PDF is given. Needs tesseract installed; backends whose
+engine is missing are reported and skipped.
+"""
+import argparse
+import random
+import statistics
+import string
+import time
+
+import pdfplumber
+from PIL import Image, ImageDraw, ImageFont
+
+from smo_ocr import BACKENDS, available_backends, best_smo_match, get_backend
+
+WORDS = ["Invoice", "Total", "weight", "Carrier", "Port", "Consignee", "pallets", "seal", "Date"]
+
+
+def synthetic_page(rng, dpi):
+    """
+    A4 page with lines of filler text and one SMO reference.
+    """
+    width, height = int(8.27 * dpi), int(11.69 * dpi)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    size = max(10, dpi // 8)
+    try:
+        font = ImageFont.truetype("DejaVuSans.ttf", size)
+    except OSError:
+        font = ImageFont.load_default()
+
+    ref = "SMO" + "".join(rng.choices(string.digits, k=8))
+    ref_line = rng.randrange(5, 40)
+    for i in range(45):
+        text = " ".join(rng.choices(WORDS, k=8))
+        if i == ref_line:
+            text = f"Shipment reference: {ref}"
+        draw.text((dpi // 2, dpi // 2 + i * int(size * 1.4)), text, fill=0, font=font)
+    return image, ref
+
+
+def pdf_pages(path, dpi, limit):
+    with pdfplumber.open(path) as pdf:
+        return [(page.to_image(resolution=dpi).original, None) for page in pdf.pages[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("pdf", nargs="?", help="Scanned PDF to benchmark on (default: synthetic pages)")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.pdf:
+        pages = pdf_pages(args.pdf, args.dpi, args.pages)
+    else:
+        rng = random.Random(args.seed)
+        pages = [synthetic_page(rng, args.dpi) for _ in range(args.pages)]
+
+    print(f"{len(pages)} pages at {args.dpi} DPI")
+    for name in BACKENDS:
+        if name not in available_backends():
+            print(f"{name:>12}: not installed")
+            continue
+
+        backend = get_backend(name)
+        try:
+            # Warm-up page: loads the engine / language data once
+            backend.image_to_data(pages[0][0])
+        except Exception as e:
+            print(f"{name:>12}: unavailable ({e})")
+            continue
+
+        latencies = []
+        found = 0
+        for image, ref in pages:
+            start = time.perf_counter()
+            match, _ = best_smo_match(backend.image_to_data(image))
+            latencies.append((time.perf_counter() - start) * 1000)
+            # Real PDFs have no known reference; count pages with any match
+            found += match is not None if ref is None else match == ref
+
+        print(
+            f"{name:>12}: mean {statistics.mean(latencies):8.1f} ms/page  "
+            f"p50 {statistics.median(latencies):8.1f}  max {max(latencies):8.1f}  "
+            f"matches {found}/{len(pages)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
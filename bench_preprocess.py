@@ -0,0 +1,103 @@
+"""
+Benchmark: image_preprocess steps on noisy, skewed grey scans.
+
+    python bench_preprocess.py [--pages 5] [--dpi 300] [--skew 2.5]
+
+Renders synthetic A4 pages with an SMO reference, degrades them (grey
+gradient background, speckle noise, rotation), then reports preprocessing
+time, OCR time and SMO confidence per step combination. Without tesseract
+only the preprocessing times are reported.
+"""
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+
+from bench_ocr_backends import synthetic_page
+from image_preprocess import preprocess_image
+from smo_ocr import DEFAULT_BACKEND, best_smo_match, get_backend
+
+CONFIGS = [
+    (),
+    ("grayscale",),
+    ("threshold",),
+    ("threshold", "despeckle"),
+    ("threshold", "despeckle", "deskew"),
+    ("grayscale", "threshold", "despeckle", "deskew", "crop"),
+]
+
+
+def degrade(image, rng, skew):
+    """
+    Grey gradient background, salt-and-pepper speckle and a small rotation,
+    roughly what a tired office scanner produces.
+    """
+    arr = np.asarray(image).astype(np.float32)
+    h, w = arr.shape
+    gradient = np.linspace(0, 70, w, dtype=np.float32)[None, :] + np.linspace(0, 40, h, dtype=np.float32)[:, None]
+    arr = np.clip(arr - gradient * (arr > 128), 0, 255)
+
+    noise = np.random.default_rng(rng.randrange(2 ** 32))
+    specks = noise.random(arr.shape)
+    arr[specks < 0.002] = 0
+    arr[specks > 0.998] = 255
+
+    angle = rng.uniform(-skew, skew)
+    return Image.fromarray(arr.astype(np.uint8)).rotate(angle, resample=Image.BILINEAR, expand=True, fillcolor=200)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--skew", type=float, default=2.5, help="Maximum page rotation in degrees")
+    parser.add_argument("--backend", default=DEFAULT_BACKEND)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    pages = []
+    for _ in range(args.pages):
+        image, ref = synthetic_page(rng, args.dpi)
+        pages.append((degrade(image, rng, args.skew), ref))
+
+    try:
+        backend = get_backend(args.backend)
+        backend.image_to_data(pages[0][0])
+    except Exception as e:
+        print(f"OCR backend '{args.backend}' unavailable ({e}); timing preprocessing only")
+        backend = None
+
+    print(f"{len(pages)} pages at {args.dpi} DPI, skew up to {args.skew} degrees")
+    for steps in CONFIGS:
+        prep_ms, ocr_ms, confs = [], [], []
+        found = 0
+        for image, ref in pages:
+            start = time.perf_counter()
+            cleaned = preprocess_image(image, steps)
+            prep_ms.append((time.perf_counter() - start) * 1000)
+
+            if backend is None:
+                continue
+            start = time.perf_counter()
+            match, conf = best_smo_match(backend.image_to_data(cleaned))
+            ocr_ms.append((time.perf_counter() - start) * 1000)
+            if match == ref:
+                found += 1
+                confs.append(conf)
+
+        line = f"{'+'.join(steps) or 'none':>42}: preprocess {statistics.mean(prep_ms):7.1f} ms/page"
+        if backend is not None:
+            mean_conf = statistics.mean(confs) if confs else 0
+            line += (
+                f"  OCR {statistics.mean(ocr_ms):7.1f} ms/page"
+                f"  matches {found}/{len(pages)}  mean conf {mean_conf:5.1f}%"
+            )
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark: vectorized best_smo_match vs the original iterrows() loop.
+
+    python bench_smo_match.py [--pages 50] [--words 3000]
+
+Runs on synthetic pytesseract.image_to_data pages (no tesseract needed),
+checks both give identical results, then reports ms per page.
+"""
+import argparse
+import random
+import re
+import string
+import time
+
+import numpy as np
+import pandas as pd
+
+from smo_ocr import best_smo_match
+
+
+# ---------------- ORIGINAL IMPLEMENTATION ----------------
+def legacy_page_match(ocr_data):
+    best_match = None
+    best_confidence = 0
+
+    ocr_data = ocr_data.dropna(subset=["text", "conf"])
+    ocr_data["clean_text"] = (
+        ocr_data["text"].astype(str).str.upper().str.replace(" ", "")
+    )
+
+    for _, row in ocr_data.iterrows():
+        match = re.search(r"SMO[A-Z0-9]+", row["clean_text"])
+        if match:
+            conf = float(row["conf"])
+            if conf > best_confidence:
+                best_match = match.group(0)
+                best_confidence = conf
+
+    return best_match, best_confidence
+
+
+# ---------------- SYNTHETIC PAGES ----------------
+WORDS = ["Invoice", "Total", "kg", "Carrier", "Port", "Consignee", "pallets",
+         "seal", "Smith", "ref:", "No.", "Date", "12/03/2024", "|", "—",
+         # Words ending in S followed by one starting MO: not a split reference
+         "ITEMS", "MONDAY", "moved", "SM", "Models"]
+
+
+def random_smo(rng):
+    # References always carry digits
+    body = rng.choices(string.ascii_uppercase + string.digits, k=rng.randint(5, 9))
+    body.insert(rng.randint(0, len(body)), rng.choice(string.digits))
+    return "SMO" + "".join(body)
+
+
+def random_page(rng, n_words, split_refs=False):
+    """
+    Returns (page DataFrame, set of SMO references printed on it).
+    """
+    rows = []
+    refs = set()
+    line, block, word = 1, 1, 0
+    for _ in range(n_words):
+        if rng.random() < 0.1:
+            # Structural row tesseract emits for each new line: no text, conf -1
+            line += 1
+            word = 0
+            rows.append((4, 1, block, 1, line, 0, np.nan, -1.0))
+            if rng.random() < 0.1:
+                block += 1
+        word += 1
+        conf = round(rng.uniform(20, 96), 6)
+        if rng.random() < 0.002:
+            ref = random_smo(rng)
+            refs.add(ref)
+            if split_refs:
+                cut = rng.randint(1, 3)
+                rows.append((5, 1, block, 1, line, word, ref[:cut], conf))
+                word += 1
+                rows.append((5, 1, block, 1, line, word, ref[cut:], round(rng.uniform(20, 96), 6)))
+                continue
+            rows.append((5, 1, block, 1, line, word, ref.lower() if rng.random() < 0.2 else ref, conf))
+        else:
+            rows.append((5, 1, block, 1, line, word, rng.choice(WORDS), conf))
+
+    page = pd.DataFrame(
+        rows,
+        columns=["level", "page_num", "block_num", "par_num", "line_num", "word_num", "text", "conf"],
+    )
+    return page, refs
+
+
+def time_per_page(fn, pages, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for page in pages:
+            fn(page)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000 / len(pages)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, default=50)
+    parser.add_argument("--words", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    plain_pages = [random_page(rng, args.words) for _ in range(args.pages)]
+    pages = [page for page, _ in plain_pages]
+    split_pages = [random_page(rng, args.words, split_refs=True) for _ in range(args.pages)]
+
+    mismatches = sum(
+        legacy_page_match(page.copy()) != best_smo_match(page, rebuild_split=False)
+        for page in pages
+    )
+    found = sum(legacy_page_match(page.copy())[0] is not None for page in pages)
+
+    with_refs = sum(bool(refs) for _, refs in split_pages)
+    legacy_split = sum(legacy_page_match(page.copy())[0] in refs for page, refs in split_pages)
+    rebuilt_split = sum(best_smo_match(page)[0] in refs for page, refs in split_pages)
+    false_split = sum(
+        best_smo_match(page)[0] not in refs | {None}
+        for page, refs in plain_pages + split_pages
+    )
+
+    legacy = time_per_page(lambda p: legacy_page_match(p.copy()), pages, args.repeat)
+    vectorized = time_per_page(lambda p: best_smo_match(p, rebuild_split=False), pages, args.repeat)
+    rebuilding = time_per_page(best_smo_match, pages, args.repeat)
+
+    print(f"{args.pages} pages x {args.words} words, {found} pages with an SMO reference")
+    print(f"identical results:            {args.pages - mismatches}/{args.pages}")
+    print(f"iterrows loop (original):     {legacy:8.2f} ms/page")
+    print(f"vectorized:                   {vectorized:8.2f} ms/page  ({legacy / vectorized:.1f}x)")
+    print(f"vectorized + split rebuild:   {rebuilding:8.2f} ms/page  ({legacy / rebuilding:.1f}x)")
+    print(f"split references recovered:   original {legacy_split}/{with_refs}, rebuilt {rebuilt_split}/{with_refs}")
+    print(f"false references rebuilt:     {false_split}")
+
+    if mismatches or false_split:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
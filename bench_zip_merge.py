@@ -0,0 +1,105 @@
+"""
+Benchmark: plain vs optimised merge of a synthetic shipment ZIP.
+
+    python bench_zip_merge.py [--pdfs 40] [--pages 2] [--quality 60]
+
+Every PDF in the ZIP embeds the same logo image and TrueType font, as
+scanned shipment bundles from one sender do. Reports merge time and
+output size for a plain merge, an optimised merge and an optimised merge
+with JPEG image recompression.
+"""
+import argparse
+import io
+import random
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+from fpdf import FPDF
+from PIL import Image
+from pypdf import PdfReader
+
+from zip_merge import merge_pdfs_from_zip
+
+FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+
+
+def make_logo(seed):
+    """
+    Noisy RGB logo, so it doesn't compress away to nothing.
+    """
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (300, 600, 3), dtype=np.uint8)
+    pixels[::8] = (20, 60, 140)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_pdf(rng, logo, pages):
+    pdf = FPDF()
+    try:
+        pdf.add_font("DejaVu", fname=FONT_PATH)
+        pdf.set_font("DejaVu", size=11)
+    except (FileNotFoundError, OSError):
+        pdf.set_font("helvetica", size=11)
+
+    for _ in range(pages):
+        pdf.add_page()
+        pdf.image(io.BytesIO(logo), x=10, y=10, w=60)
+        pdf.set_y(50)
+        for _ in range(30):
+            pdf.cell(0, 6, f"Pallet {rng.randrange(10 ** 6):06d}  seal {rng.randrange(10 ** 8):08d}", new_x="LMARGIN", new_y="NEXT")
+    return bytes(pdf.output())
+
+
+def make_zip(n_pdfs, pages, seed):
+    rng = random.Random(seed)
+    logo = make_logo(seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for i in range(n_pdfs):
+            zipf.writestr(f"shipment/{i:04d}.pdf", make_pdf(rng, logo, pages))
+    buffer.name = "bench.zip"
+    return buffer
+
+
+def run(zip_buffer, **options):
+    zip_buffer.seek(0)
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        output_path, _, stats = merge_pdfs_from_zip(zip_buffer, out_dir, **options)
+        elapsed = time.perf_counter() - start
+        pages = len(PdfReader(output_path).pages)
+    return elapsed, stats, pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pdfs", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--quality", type=int, default=60, help="JPEG quality for the recompression run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    zip_buffer = make_zip(args.pdfs, args.pages, args.seed)
+    print(f"{args.pdfs} PDFs x {args.pages} pages, ZIP {len(zip_buffer.getvalue()) / 1024 ** 2:.2f} MB")
+
+    configs = [
+        ("plain", {}),
+        ("optimised", {"optimize": True}),
+        (f"optimised + JPEG q{args.quality}", {"optimize": True, "image_quality": args.quality}),
+    ]
+    baseline = None
+    for label, options in configs:
+        elapsed, stats, pages = run(zip_buffer, **options)
+        baseline = baseline or stats["output_bytes"]
+        print(
+            f"{label:>24}: {elapsed:6.2f} s  {stats['output_bytes'] / 1024 ** 2:8.2f} MB "
+            f"({stats['output_bytes'] / baseline:6.1%} of plain)  {pages} pages"
+        )
+
+
+if __name__ == "__main__":
+    main()
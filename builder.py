@@ -1,12 +1,15 @@
 import streamlit as st
 import openai
 import io
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
 import re
+import csv
+import logging
+import time
+import zipfile
 
 # Try importing PDF reader - handle both package names
 try:
@@ -14,8 +17,24 @@ try:
 except ImportError:
     from PyPDF2 import PdfReader
 
-# Import for PDF generation
-from fpdf import FPDF
+# PDF / DOCX generation
+from resume_doc import parse_resume, render_docx, render_pdf, to_markdown
+
+from llm_cache import ResponseCache
+from llm_client import run_chat_batch, stream_chat
+from mail_queue import FINAL_STATUSES, MailQueue
+from prompt_budget import INPUT_TOKEN_BUDGET, PAGE_BREAK, fit_prompt
+
+# Under Streamlit __name__ is "__main__" and the root logger only shows
+# warnings, so the app's INFO lines (token counts, stream timings) get
+# their own handler; reruns reuse the logger and must not add another
+logger = logging.getLogger("builder")
+if not logger.handlers:
+    _log_handler = logging.StreamHandler()
+    _log_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    logger.addHandler(_log_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
 
 # Page configuration
 st.set_page_config(
@@ -37,6 +56,29 @@ with st.sidebar:
         help="Enter your OpenAI API key to use the optimizer"
     )
     
+    mode = st.radio(
+        "Mode",
+        ["Single job description", "Batch (many job descriptions)"],
+        help="Batch mode optimizes one CV against many job descriptions at once and returns a ZIP of PDFs"
+    )
+    batch_mode = mode.startswith("Batch")
+    concurrency = st.slider(
+        "Parallel API requests",
+        min_value=1,
+        max_value=16,
+        value=8,
+        disabled=not batch_mode,
+        help="Batch requests in flight at once; rate-limited requests are retried with backoff"
+    )
+    token_budget = st.number_input(
+        "Input token budget",
+        min_value=2000,
+        max_value=100000,
+        value=INPUT_TOKEN_BUDGET,
+        step=500,
+        help="Prompt size limit per request; job descriptions are trimmed to their relevant sections to fit"
+    )
+    
     st.markdown("---")
     st.markdown("### Email Settings (Optional)")
     st.markdown("*Fill these to receive results via email*")
@@ -223,174 +265,265 @@ If any bullet does not meet these standards, rewrite it before outputting the fi
 
 
 def extract_text_from_pdf(pdf_file):
-    """Extract text from uploaded PDF file"""
+    """Extract text from uploaded PDF file. Pages are separated by form feeds
+    so running headers / footers can be told apart from content later"""
     try:
         pdf_reader = PdfReader(io.BytesIO(pdf_file.read()))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
+        return PAGE_BREAK.join(page.extract_text() for page in pdf_reader.pages)
     except Exception as e:
         st.error(f"Error reading PDF: {str(e)}")
         return None
 
 
-def optimize_resume(cv_text, job_description, api_key):
-    """Call OpenAI API to optimize resume"""
-    try:
-        client = openai.OpenAI(api_key=api_key)
-        
-        user_prompt = f"""I am providing two artifacts:
+MODEL = "gpt-4o-mini"
+TEMPERATURE = 0.7
+
+
+@st.cache_resource
+def get_llm_cache():
+    return ResponseCache()
+
+
+def build_user_prompt(cv_text, job_description):
+    return f"""I am providing two artifacts:
 
 My current resume:
 {cv_text}
 
 A target job description (JD) for the role I am applying to:
 {job_description}"""
+
+
+def prepare_prompt(cv_text, job_description, token_budget=INPUT_TOKEN_BUDGET):
+    """Compact the resume and JD to fit the input token budget and size
+    max_tokens for the answer. Returns (user prompt, max_tokens)"""
+    user_prompt, max_tokens, counts = fit_prompt(
+        SYSTEM_PROMPT, cv_text, job_description, build_user_prompt, MODEL, token_budget
+    )
+    logger.info(
+        "LLM request tokens%s: system %d, resume %d, JD %d (of %d), input %d/%d, max_tokens %d",
+        "" if counts["exact"] else " (estimated)",
+        counts["system"], counts["resume"], counts["jd"], counts["jd_original"],
+        counts["input"], counts["budget"], max_tokens
+    )
+    return user_prompt, max_tokens
+
+
+def chat_request(user_prompt, max_tokens):
+    """Chat completion arguments for one optimization"""
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ],
+        "temperature": TEMPERATURE,
+        "max_tokens": max_tokens
+    }
+
+
+def cache_parts(user_prompt, max_tokens):
+    """Everything that shapes the answer, for the response cache key"""
+    return {
+        "model": MODEL,
+        "system": SYSTEM_PROMPT,
+        "temperature": TEMPERATURE,
+        "max_tokens": max_tokens,
+        "prompt": user_prompt
+    }
+
+
+def optimize_resume(cv_text, job_description, api_key, force=False, on_text=None,
+                    token_budget=INPUT_TOKEN_BUDGET):
+    """Call OpenAI API to optimize resume, reusing cached answers.
+    The answer is streamed, with on_text(text so far) called as tokens arrive.
+    Returns (optimized resume or None, served from cache, stream stats or None)"""
+    try:
+        client = openai.OpenAI(api_key=api_key)
+        user_prompt, max_tokens = prepare_prompt(cv_text, job_description, token_budget)
+        stats = {}
         
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.7,
-            max_tokens=4000
-        )
+        def create():
+            text, stream_stats = stream_chat(client, on_text, **chat_request(user_prompt, max_tokens))
+            stats.update(stream_stats)
+            # Logged through the builder handler; a cut-off answer is worth a warning
+            logger.log(
+                logging.WARNING if stream_stats["finish_reason"] == "length" else logging.INFO,
+                "LLM stream: first token %.2fs, %d tokens in %.1fs (%.0f tokens/s), finish %s",
+                stream_stats["ttft_s"] or 0, stream_stats["tokens"],
+                stream_stats["total_s"], stream_stats["tokens_per_s"], stream_stats["finish_reason"]
+            )
+            return text
         
-        return response.choices[0].message.content
+        text, cached = get_llm_cache().get_or_create(
+            create, force=force, **cache_parts(user_prompt, max_tokens)
+        )
+        return text, cached, stats or None
     except Exception as e:
         st.error(f"Error calling OpenAI API: {str(e)}")
-        return None
+        return None, False, None
 
 
-class PDF(FPDF):
-    """Custom PDF class for resume"""
-    def header(self):
-        pass
-    
-    def footer(self):
-        pass
+JD_SEPARATOR = "==="
 
 
-def create_pdf(text):
-    """Convert resume text to PDF format using FPDF"""
-    pdf = PDF()
-    pdf.add_page()
-    pdf.set_auto_page_break(auto=True, margin=15)
-    pdf.set_left_margin(15)
-    pdf.set_right_margin(15)
+def parse_job_descriptions(text, csv_file=None):
+    """Collect (title, job description) pairs from the batch text area,
+    where entries are separated by a line containing only ===, and from an
+    optional CSV with a description column (and optionally a title column)"""
+    jobs = []
     
-    lines = text.split('\n')
+    for block in re.split(rf"^\s*{JD_SEPARATOR}\s*$", text or "", flags=re.MULTILINE):
+        block = block.strip()
+        if block:
+            jobs.append((block.splitlines()[0][:60], block))
     
-    for line in lines:
-        line = line.strip()
-        
-        if not line:
-            pdf.ln(3)
-            continue
-        
-        # Clean special characters that might cause issues
-        clean_line = line
-        # Replace common problematic characters
-        clean_line = clean_line.replace('—', '-')  # em dash
-        clean_line = clean_line.replace('–', '-')  # en dash
-        clean_line = clean_line.replace('"', '"')  # smart quotes
-        clean_line = clean_line.replace('"', '"')
-        clean_line = clean_line.replace(''', "'")
-        clean_line = clean_line.replace(''', "'")
-        clean_line = clean_line.replace('…', '...')
-        # Remove markdown bold markers for display
-        clean_line = re.sub(r'\*\*(.*?)\*\*', r'\1', clean_line)
-        
-        # Encode to handle any remaining special characters
-        try:
-            # Remove any non-ASCII characters
-            clean_line = ''.join(char if ord(char) < 128 else ' ' for char in clean_line)
-        except:
-            clean_line = ''.join(char for char in clean_line if ord(char) < 128)
-        
-        # Handle different types of content
-        try:
-            if line.startswith('# '):
-                # Main title
-                pdf.set_font('Arial', 'B', 16)
-                text_content = clean_line.replace('# ', '')
-                if text_content:
-                    pdf.multi_cell(0, 8, text_content)
-                pdf.ln(2)
-            elif line.startswith('## '):
-                # Section heading
-                pdf.set_font('Arial', 'B', 12)
-                pdf.ln(2)
-                text_content = clean_line.replace('## ', '')
-                if text_content:
-                    pdf.multi_cell(0, 6, text_content)
-                pdf.ln(1)
-            elif line.startswith('### '):
-                # Subsection
-                pdf.set_font('Arial', 'B', 10)
-                text_content = clean_line.replace('### ', '')
-                if text_content:
-                    pdf.multi_cell(0, 5, text_content)
-                pdf.ln(1)
-            elif line.startswith('* '):
-                # Bullet point
-                pdf.set_font('Arial', '', 9)
-                text_content = clean_line.replace('* ', '- ')
-                if text_content:
-                    pdf.multi_cell(0, 5, text_content)
-            elif line == '---':
-                # Horizontal rule
-                pdf.ln(2)
-            else:
-                # Normal text
-                pdf.set_font('Arial', '', 10)
-                if clean_line:
-                    pdf.multi_cell(0, 5, clean_line)
-        except Exception as e:
-            # If any line fails, skip it and continue
-            print(f"Skipping line due to error: {str(e)}")
-            continue
+    if csv_file is not None:
+        rows = csv.DictReader(io.StringIO(csv_file.getvalue().decode("utf-8-sig")))
+        columns = {name.strip().lower(): name for name in rows.fieldnames or []}
+        if "description" not in columns:
+            raise ValueError("CSV needs a 'description' column (and optionally 'title')")
+        for row in rows:
+            description = (row[columns["description"]] or "").strip()
+            if description:
+                title = (row.get(columns.get("title", ""), "") or "").strip()
+                jobs.append((title or description.splitlines()[0][:60], description))
+    
+    return jobs
+
+
+def optimize_resume_batch(cv_text, jobs, api_key, concurrency=8, force=False, on_done=None,
+                          token_budget=INPUT_TOKEN_BUDGET):
+    """Optimize one CV against many job descriptions. Cached answers are
+    used as-is and the rest run concurrently on the async client.
+    on_done(index, result) is called as each job finishes.
+    Returns one (optimized resume or None, served from cache, error or None) per job"""
+    cache = get_llm_cache()
+    prompts = [prepare_prompt(cv_text, description, token_budget) for _, description in jobs]
+    results = [None] * len(jobs)
+    pending = []
     
-    # Return PDF as bytes using fpdf2 syntax
-    return pdf.output()
+    for i, prompt in enumerate(prompts):
+        text = None if force else cache.get(**cache_parts(*prompt))
+        if text:
+            results[i] = (text, True, None)
+            if on_done:
+                on_done(i, results[i])
+        else:
+            pending.append(i)
+    
+    def finished(k, result):
+        i = pending[k]
+        if isinstance(result, Exception):
+            results[i] = (None, False, str(result))
+        else:
+            if result:
+                cache.put(result, **cache_parts(*prompts[i]))
+            results[i] = (result, False, None if result else "Empty response")
+        if on_done:
+            on_done(i, results[i])
+    
+    if pending:
+        run_chat_batch(
+            [chat_request(*prompts[i]) for i in pending],
+            concurrency=concurrency,
+            on_done=finished,
+            api_key=api_key
+        )
+    return results
 
 
-def send_email(recipient_email, pdf_data, smtp_server, smtp_port, sender_email, sender_password):
-    """Send email with optimized resume as PDF attachment"""
-    try:
-        msg = MIMEMultipart()
-        msg['Subject'] = "Your ATS Optimized Resume"
-        msg['From'] = sender_email
-        msg['To'] = recipient_email
-        
-        # Email body
-        body = """Hello,
+def build_batch_zip(jobs, results):
+    """A PDF and a DOCX per successfully optimized job description, zipped.
+    Each answer is parsed once for both formats"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for n, ((title, _), (text, _, _)) in enumerate(zip(jobs, results), start=1):
+            if text:
+                slug = re.sub(r"[^A-Za-z0-9]+", "_", title).strip("_")[:40] or "job"
+                blocks = parse_resume(text)
+                zipf.writestr(f"{n:02d}_{slug}_resume.pdf", render_pdf(blocks))
+                zipf.writestr(f"{n:02d}_{slug}_resume.docx", render_docx(blocks).getvalue())
+    return buffer.getvalue()
+
+
+def create_pdf(text):
+    """Convert resume text to PDF bytes (parsed once, see resume_doc)"""
+    return render_pdf(parse_resume(text))
+
+
+def create_docx(text):
+    """Convert resume text to a DOCX file (parsed once, see resume_doc)"""
+    return render_docx(parse_resume(text))
+
+
+@st.cache_resource
+def get_mail_queue():
+    return MailQueue()
+
+
+def build_email(recipient_email, pdf_data, sender_email):
+    """Email with the optimized resume as PDF attachment"""
+    msg = MIMEMultipart()
+    msg['Subject'] = "Your ATS Optimized Resume"
+    msg['From'] = sender_email
+    msg['To'] = recipient_email
+    
+    # Email body
+    body = """Hello,
 
 Your ATS-optimized resume is attached to this email.
 
 Best regards,
 ATS Resume Optimizer"""
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Attach PDF
-        pdf_attachment = MIMEBase('application', 'pdf')
-        pdf_attachment.set_payload(pdf_data)
-        encoders.encode_base64(pdf_attachment)
-        pdf_attachment.add_header('Content-Disposition', 'attachment', filename='optimized_resume.pdf')
-        msg.attach(pdf_attachment)
-        
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
-        
-        return True
-    except Exception as e:
-        st.error(f"Error sending email: {str(e)}")
-        return False
+    
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Attach PDF
+    pdf_attachment = MIMEBase('application', 'pdf')
+    pdf_attachment.set_payload(pdf_data)
+    encoders.encode_base64(pdf_attachment)
+    pdf_attachment.add_header('Content-Disposition', 'attachment', filename='optimized_resume.pdf')
+    msg.attach(pdf_attachment)
+    return msg
+
+
+def send_email(recipient_email, pdf_data, smtp_server, smtp_port, sender_email, sender_password):
+    """Queue the email for background delivery over a pooled SMTP connection.
+    Returns the job id, shown by email_status"""
+    job_id = get_mail_queue().submit(
+        build_email(recipient_email, pdf_data, sender_email),
+        smtp_server, smtp_port, sender_email, sender_password
+    )
+    st.session_state.setdefault("mail_jobs", []).append(job_id)
+    return job_id
+
+
+@st.fragment(run_every=2)
+def email_status():
+    """Delivery status of this session's emails, refreshed without rerunning the page"""
+    # The queue forgets finished jobs once reported, so their final status is kept here
+    finished = st.session_state.setdefault("mail_finished", {})
+    jobs = []
+    for job_id in st.session_state.get("mail_jobs", []):
+        job = finished.get(job_id) or get_mail_queue().status(job_id)
+        if job is None:
+            continue
+        if job["status"] in FINAL_STATUSES:
+            finished[job_id] = job
+        jobs.append(job)
+    if not jobs:
+        return
+    
+    icons = {"queued": "⏳", "sending": "📤", "retrying": "🔁", "sent": "✅", "failed": "❌"}
+    st.markdown("### 📧 Email Delivery")
+    for job in jobs[-5:]:
+        line = f"{icons[job['status']]} {job['recipient']}: {job['status']}"
+        if job["status"] not in FINAL_STATUSES and job["attempts"] > 1:
+            line += f" (attempt {job['attempts']})"
+        if job["error"]:
+            line += f" - {job['error']}"
+        st.write(line)
 
 
 # Main form
@@ -403,21 +536,97 @@ with st.form("resume_form"):
         help="Upload your current resume in PDF format"
     )
     
-    job_description = st.text_area(
-        "Job Description",
-        height=200,
-        help="Paste the job description you're applying for"
-    )
+    if batch_mode:
+        job_description = st.text_area(
+            "Job Descriptions",
+            height=300,
+            help=f"Paste several job descriptions, separated by a line containing only {JD_SEPARATOR}"
+        )
+        jd_csv = st.file_uploader(
+            "...and/or upload a CSV of job descriptions",
+            type=['csv'],
+            help="Columns: description, and optionally title"
+        )
+        email_id = ""
+    else:
+        job_description = st.text_area(
+            "Job Description",
+            height=200,
+            help="Paste the job description you're applying for"
+        )
+        jd_csv = None
+        
+        email_id = st.text_input(
+            "Email ID (Optional)",
+            help="Enter your email to receive the optimized resume"
+        )
     
-    email_id = st.text_input(
-        "Email ID (Optional)",
-        help="Enter your email to receive the optimized resume"
+    force_regenerate = st.checkbox(
+        "Force regenerate",
+        help="Ignore the cached answer for this CV and job description and call the API again"
     )
     
     submit_button = st.form_submit_button("🚀 Optimize Resume")
 
 # Process form submission
-if submit_button:
+if st.session_state.get("stop_generation"):
+    st.info("⏹ Generation stopped")
+
+if submit_button and batch_mode:
+    # Validation
+    try:
+        jobs = parse_job_descriptions(job_description, jd_csv)
+    except ValueError as e:
+        st.error(f"⚠️ {str(e)}")
+        jobs = None
+    
+    if not openai_api_key:
+        st.error("⚠️ Please enter your OpenAI API key in the sidebar")
+    elif not cv_file:
+        st.error("⚠️ Please upload your CV")
+    elif jobs == []:
+        st.error("⚠️ Please enter at least one job description")
+    elif jobs:
+        # The CV is extracted once for the whole batch
+        with st.spinner("🔄 Extracting text from CV..."):
+            cv_text = extract_text_from_pdf(cv_file)
+        
+        if cv_text:
+            progress = st.progress(0.0, text=f"🤖 Optimizing against {len(jobs)} job descriptions...")
+            finished = []
+            
+            def on_done(index, result):
+                finished.append(index)
+                progress.progress(len(finished) / len(jobs), text=f"🤖 {len(finished)}/{len(jobs)} done")
+            
+            start = time.perf_counter()
+            results = optimize_resume_batch(
+                cv_text, jobs, openai_api_key, concurrency, force_regenerate, on_done, token_budget
+            )
+            elapsed = time.perf_counter() - start
+            
+            succeeded = sum(1 for text, _, _ in results if text)
+            st.success(f"✅ {succeeded}/{len(jobs)} resumes optimized in {elapsed:.1f}s")
+            st.dataframe([
+                {
+                    "#": n,
+                    "Job": title,
+                    "Status": ("✅ cached" if cached else "✅") if text else f"❌ {error}"
+                }
+                for n, ((title, _), (text, cached, error)) in enumerate(zip(jobs, results), start=1)
+            ])
+            
+            if succeeded:
+                with st.spinner("📄 Generating PDFs..."):
+                    zip_data = build_batch_zip(jobs, results)
+                st.download_button(
+                    label=f"📦 Download {succeeded} Optimized Resumes (ZIP)",
+                    data=zip_data,
+                    file_name="optimized_resumes.zip",
+                    mime="application/zip"
+                )
+
+elif submit_button:
     # Validation
     if not openai_api_key:
         st.error("⚠️ Please enter your OpenAI API key in the sidebar")
@@ -430,15 +639,34 @@ if submit_button:
             cv_text = extract_text_from_pdf(cv_file)
         
         if cv_text:
-            with st.spinner("🤖 Optimizing your resume with AI... This may take a minute."):
-                optimized_resume = optimize_resume(cv_text, job_description, openai_api_key)
+            st.subheader("📋 Your Optimized Resume")
+            # Clicking stop reruns the script, which interrupts the stream and closes the request
+            stop_slot = st.empty()
+            stop_slot.button("⏹ Stop generating", key="stop_generation")
+            preview = st.empty()
+            preview.caption("🤖 Optimizing your resume with AI...")
+            
+            optimized_resume, cached, stream_stats = optimize_resume(
+                cv_text, job_description, openai_api_key, force_regenerate,
+                on_text=lambda text: preview.markdown(text + " ▌"),
+                token_budget=token_budget
+            )
+            stop_slot.empty()
             
             if optimized_resume:
-                st.success("✅ Resume optimized successfully!")
-                
                 # Display the result
-                st.subheader("📋 Your Optimized Resume")
-                st.markdown(optimized_resume)
+                preview.markdown(to_markdown(parse_resume(optimized_resume)))
+                
+                st.success("✅ Resume optimized successfully!" + (" (from cache)" if cached else ""))
+                if stream_stats:
+                    st.caption(
+                        f"First token after {stream_stats['ttft_s'] or 0:.2f}s, "
+                        f"{stream_stats['tokens']} tokens at {stream_stats['tokens_per_s']:.0f} tokens/s"
+                    )
+                    if stream_stats["finish_reason"] == "length":
+                        st.warning("⚠️ The answer hit its token limit and may be cut off")
+                hits, misses, entries, size = get_llm_cache().stats()
+                st.caption(f"Response cache: {hits} hits / {misses} misses, {entries} entries ({size / 1024:.0f} KB)")
                 
                 # Generate PDF
                 with st.spinner("📄 Generating PDF..."):
@@ -452,6 +680,14 @@ if submit_button:
                     mime="application/pdf"
                 )
                 
+                # Word version from the same parsed document
+                st.download_button(
+                    label="📄 Download as DOCX",
+                    data=create_docx(optimized_resume),
+                    file_name="optimized_resume.docx",
+                    mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                )
+                
                 # Also offer text download
                 st.download_button(
                     label="📝 Download as Text",
@@ -462,13 +698,14 @@ if submit_button:
                 
                 # Send email if requested and configured
                 if email_id and sender_email and sender_password:
-                    with st.spinner("📧 Sending email..."):
-                        if send_email(email_id, pdf_data, smtp_server, smtp_port, sender_email, sender_password):
-                            st.success(f"✅ Email with PDF sent to {email_id}")
-                        else:
-                            st.warning("⚠️ Resume optimized but email failed to send")
+                    send_email(email_id, pdf_data, smtp_server, smtp_port, sender_email, sender_password)
+                    st.info(f"📧 Email with PDF to {email_id} queued; delivery status is shown below")
                 elif email_id:
                     st.info("ℹ️ To send emails, configure SMTP settings in the sidebar")
+            else:
+                preview.empty()
+
+email_status()
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,110 @@
+import re
+import json
+import hashlib
+
+# ---------------- CONFIG ----------------
+ID_REGEX = re.compile(r"\bS[A-Z0-9]{6,}\b")
+KEYWORDS_SHIPMENT = ("SHIPMENT NUMBER", "SHIPMENT#", "SHIPMENT NO", "SHIPMENT")
+KEYWORDS_REFERENCE = ("REFERENCES", "REFERENCE", "REF")
+
+# (rule name, line keywords, score bonus), highest priority first.
+# A candidate on a line matching an earlier rule always wins over later rules.
+DEFAULT_RULES = (
+    ("SHIPMENT", KEYWORDS_SHIPMENT, 100),
+    ("REFERENCE", KEYWORDS_REFERENCE, 60),
+)
+
+
+# ---------------- HELPERS ----------------
+def normalize_text(s):
+    return s.replace("\u00A0", " ").replace("\t", " ")
+
+
+def load_rules(path):
+    """
+    Read scoring rules from a JSON file:
+    [{"name": "SHIPMENT", "keywords": ["SHIPMENT NO", ...], "score": 100}, ...]
+    """
+    with open(path, encoding="utf-8") as f:
+        return tuple((r["name"], tuple(r["keywords"]), int(r["score"])) for r in json.load(f))
+
+
+class IdExtractor:
+    """
+    Compiled, single-pass ID extraction.
+    Each line is upper-cased and scanned for ID tokens once; its keyword
+    rules are resolved once per line rather than once per candidate, and
+    the best candidate per rule is kept as the lines stream past.
+    """
+
+    def __init__(self, rules=DEFAULT_RULES, id_regex=ID_REGEX):
+        self.rules = tuple(rules)
+        self.id_regex = id_regex
+        self.rule_regexes = [
+            (name, re.compile("|".join(re.escape(k) for k in keywords)), score)
+            for name, keywords, score in self.rules
+        ]
+
+    @property
+    def fingerprint(self):
+        """
+        Stable hash of the rules, for cache keys.
+        """
+        spec = json.dumps([self.id_regex.pattern, self.rules])
+        return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+    def extract_lines(self, lines):
+        """
+        Returns (token, rule) with rule one of the rule names, "FALLBACK"
+        or "UNMATCHED".
+        """
+        # rule name -> (score, token); only strictly better scores replace,
+        # so ties go to the earliest candidate
+        best = {}
+
+        for line in lines:
+            up = line.upper()
+            tokens = self.id_regex.findall(up)
+            if not tokens:
+                continue
+
+            matched = [(name, score) for name, regex, score in self.rule_regexes if regex.search(up)]
+            bonus = sum(score for _, score in matched)
+            names = [name for name, _ in matched] + ["FALLBACK"]
+
+            for token in tokens:
+                score = bonus + len(token)
+                for name in names:
+                    if name not in best or score > best[name][0]:
+                        best[name] = (score, token)
+
+        for name, _, _ in self.rules:
+            if name in best:
+                return best[name][1], name
+
+        if "FALLBACK" in best:
+            return best["FALLBACK"][1], "FALLBACK"
+
+        return None, "UNMATCHED"
+
+    def extract_text(self, text):
+        return self.extract_lines(normalize_text(text).splitlines())
+
+    def extract_file(self, path):
+        """
+        Stream a sidecar text file instead of reading it into memory.
+        """
+        def lines():
+            with open(path, errors="ignore") as f:
+                for chunk in f:
+                    # Match str.splitlines(), which also breaks on form feeds between pages
+                    yield from normalize_text(chunk).splitlines()
+
+        return self.extract_lines(lines())
+
+
+DEFAULT_EXTRACTOR = IdExtractor()
+
+
+def extract_best_id(text, extractor=DEFAULT_EXTRACTOR):
+    return extractor.extract_text(text)
@@ -0,0 +1,131 @@
+"""
+Vectorized NumPy clean-up of scanned page images before tesseract.
+Each step can be switched on separately; see preprocess_image.
+"""
+import numpy as np
+from PIL import Image
+
+# Steps in the order they are applied
+PREPROCESS_STEPS = ("grayscale", "threshold", "despeckle", "deskew", "crop")
+
+
+def to_grayscale(image):
+    """
+    PIL image -> 2-D uint8 array (ITU-R 601 luma).
+    """
+    arr = np.asarray(image)
+    if arr.ndim == 2:
+        return arr.astype(np.uint8, copy=False)
+    rgb = arr[..., :3].astype(np.float32)
+    return (rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)).round().astype(np.uint8)
+
+
+def box_mean(gray, block):
+    """
+    Mean over a block x block window around every pixel, via an integral image.
+    """
+    pad = block // 2
+    padded = np.pad(gray.astype(np.float64), pad + 1, mode="edge")
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    h, w = gray.shape
+    total = (
+        integral[block:block + h, block:block + w]
+        - integral[:h, block:block + w]
+        - integral[block:block + h, :w]
+        + integral[:h, :w]
+    )
+    return total / (block * block)
+
+
+def adaptive_threshold(gray, block=31, offset=10):
+    """
+    Pixels darker than their neighbourhood mean minus offset become black (0),
+    the rest white (255). Handles uneven grey backgrounds that a single
+    global threshold would turn into black patches.
+    """
+    return np.where(gray < box_mean(gray, block) - offset, 0, 255).astype(np.uint8)
+
+
+def despeckle(binary, max_neighbours=1):
+    """
+    Turn isolated black pixels (at most max_neighbours black pixels in their
+    3x3 neighbourhood) white.
+    """
+    dark = (binary < 128).astype(np.uint8)
+    padded = np.pad(dark, 1)
+    h, w = dark.shape
+    neighbours = sum(
+        padded[1 + dy:1 + dy + h, 1 + dx:1 + dx + w]
+        for dy in (-1, 0, 1)
+        for dx in (-1, 0, 1)
+        if dy or dx
+    )
+    cleaned = binary.copy()
+    cleaned[(dark == 1) & (neighbours <= max_neighbours)] = 255
+    return cleaned
+
+
+def estimate_skew(gray, max_angle=5.0, step=0.25, sample=2000):
+    """
+    Projection-profile skew estimate: the counter-clockwise angle in
+    degrees (PIL's rotate convention) the text is turned by. Text rows give
+    the sharpest row histogram when sheared by the right angle.
+    Works on a random sample of dark pixels to stay fast on 300 DPI pages.
+    """
+    ys, xs = np.nonzero(gray < 128)
+    if len(ys) < 50:
+        return 0.0
+    if len(ys) > sample * 50:
+        pick = np.random.default_rng(0).choice(len(ys), sample * 50, replace=False)
+        ys, xs = ys[pick], xs[pick]
+
+    angles = np.arange(-max_angle, max_angle + step / 2, step)
+    # One row per candidate angle: the row each dark pixel lands in after shearing
+    shifted = (ys[None, :] + xs[None, :] * np.tan(np.radians(angles))[:, None]).round().astype(np.int64)
+    shifted -= shifted.min()
+    n_rows = shifted.max() + 1
+    offsets = (np.arange(len(angles)) * n_rows)[:, None]
+    profiles = np.bincount((shifted + offsets).ravel(), minlength=len(angles) * n_rows)
+    scores = profiles.reshape(len(angles), n_rows).astype(np.float64).var(axis=1)
+    return float(angles[scores.argmax()])
+
+
+def crop_margins(gray, pad=10):
+    """
+    Crop blank (all-white) margins, keeping pad pixels around the content.
+    """
+    dark = gray < 128
+    rows = np.flatnonzero(dark.any(axis=1))
+    cols = np.flatnonzero(dark.any(axis=0))
+    if not len(rows) or not len(cols):
+        return gray
+    top, bottom = max(rows[0] - pad, 0), min(rows[-1] + pad + 1, gray.shape[0])
+    left, right = max(cols[0] - pad, 0), min(cols[-1] + pad + 1, gray.shape[1])
+    return gray[top:bottom, left:right]
+
+
+def preprocess_image(image, steps=PREPROCESS_STEPS):
+    """
+    Apply the enabled steps (names from PREPROCESS_STEPS) to a PIL image.
+    Every step after grayscale works on a grey image, so it is implied.
+    Returns a PIL image ready for tesseract.
+    """
+    steps = set(steps)
+    if not steps:
+        return image
+
+    gray = to_grayscale(image)
+    if "threshold" in steps:
+        gray = adaptive_threshold(gray)
+    if "despeckle" in steps:
+        gray = despeckle(gray)
+    if "deskew" in steps:
+        angle = estimate_skew(gray)
+        if angle:
+            gray = np.asarray(
+                Image.fromarray(gray).rotate(-angle, resample=Image.BILINEAR, expand=True, fillcolor=255)
+            )
+    if "crop" in steps:
+        gray = crop_margins(gray)
+
+    return Image.fromarray(gray)
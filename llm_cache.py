@@ -0,0 +1,123 @@
+"""
+Persistent cache of LLM responses shared by resume.py and builder.py.
+Must not import streamlit.
+
+Entries are JSON files named by the SHA-256 of everything that shapes the
+response (model, system prompt, temperature, resume text, JD, ...), evicted
+least recently used first once the cache passes its size limit.
+The API call itself is passed in as a callable, so the cache works the same
+against OpenAI or a local stand-in (OPENAI_BASE_URL=http://localhost:...).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+CACHE_DIR = Path("runtime") / "llm_cache"
+CACHE_MAX_MB = 200
+
+
+def cache_key(**parts):
+    """
+    SHA-256 over the keyword arguments, independent of their order.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk LRU cache of response texts with hit / miss counters.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_mb=CACHE_MAX_MB):
+        self.root = Path(root)
+        self.max_bytes = max_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def lookup(self, key):
+        """
+        Cached response text for key, or None on a miss.
+        """
+        path = self.root / f"{key}.json"
+        try:
+            content = json.loads(path.read_text(encoding="utf-8"))["content"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+        # Touch the entry so LRU eviction sees it as recently used
+        os.utime(path)
+        return content
+
+    def store(self, key, content, **meta):
+        # Written to a temp file and renamed, so readers never see half an entry
+        fd, staging = tempfile.mkstemp(dir=self.root, prefix=".staging_")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"content": content, "created": time.time(), **meta}, f, ensure_ascii=False)
+        os.replace(staging, self.root / f"{key}.json")
+        self.evict()
+
+    def evict(self):
+        """
+        Drop least recently used entries until the cache fits in max_mb.
+        """
+        with self.lock:
+            entries = sorted(self.root.glob("*.json"), key=lambda e: e.stat().st_mtime)
+            sizes = {e: e.stat().st_size for e in entries}
+            total = sum(sizes.values())
+
+            for entry in entries:
+                if total <= self.max_bytes:
+                    break
+                entry.unlink(missing_ok=True)
+                total -= sizes[entry]
+
+    def get(self, **parts):
+        """
+        Cached response text for the request described by parts, or None.
+        Counts a hit or a miss.
+        """
+        content = self.lookup(cache_key(**parts))
+        with self.lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def put(self, content, **parts):
+        self.store(cache_key(**parts), content, model=parts.get("model"))
+
+    def get_or_create(self, create, force=False, **parts):
+        """
+        Return (response text, cache hit) for the request described by parts.
+        On a miss, or with force, create() is called and a non-empty result
+        is stored.
+        """
+        if force:
+            with self.lock:
+                self.misses += 1
+            content = None
+        else:
+            content = self.get(**parts)
+        if content is not None:
+            return content, True
+
+        content = create()
+        if content:
+            self.put(content, **parts)
+        return content, False
+
+    def stats(self):
+        """
+        (hits, misses, entries, bytes on disk)
+        """
+        with self.lock:
+            entries = list(self.root.glob("*.json"))
+            return self.hits, self.misses, len(entries), sum(e.stat().st_size for e in entries)
@@ -0,0 +1,174 @@
+"""
+OpenAI chat helpers shared by the resume apps. Must not import streamlit.
+Point OPENAI_BASE_URL at a local mock server to run them without the API.
+"""
+import asyncio
+import random
+import time
+
+import openai
+
+# Minimum seconds between on_text callbacks while streaming, so the UI
+# isn't re-rendered for every single token
+UPDATE_INTERVAL_S = 0.05
+
+# Batch requests: statuses worth retrying, and the backoff schedule
+RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+BACKOFF_BASE_S = 1.0
+BACKOFF_MAX_S = 60.0
+
+
+def stream_chat(client, on_text=None, **request):
+    """
+    Run a streamed chat completion, calling on_text(text so far) as tokens
+    arrive and once more with the final text.
+    The HTTP stream is closed however the loop ends, so an exception raised
+    from on_text (e.g. a Streamlit rerun or stop) cancels the request.
+    Returns (text, stats) with stats holding ttft_s (time to first token),
+    total_s, tokens, tokens_per_s and finish_reason.
+    """
+    start = time.perf_counter()
+    stream = client.chat.completions.create(
+        stream=True,
+        stream_options={"include_usage": True},
+        **request
+    )
+
+    parts = []
+    chunks = 0
+    usage_tokens = None
+    first_token = None
+    finish_reason = None
+    last_update = 0.0
+
+    try:
+        for chunk in stream:
+            # The usage-only chunk at the end has no choices
+            if getattr(chunk, "usage", None):
+                usage_tokens = chunk.usage.completion_tokens
+            if not chunk.choices:
+                continue
+
+            choice = chunk.choices[0]
+            if choice.delta and choice.delta.content:
+                now = time.perf_counter()
+                if first_token is None:
+                    first_token = now - start
+                parts.append(choice.delta.content)
+                chunks += 1
+                if on_text and now - last_update >= UPDATE_INTERVAL_S:
+                    on_text("".join(parts))
+                    last_update = now
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+    finally:
+        stream.close()
+
+    text = "".join(parts)
+    if on_text:
+        on_text(text)
+
+    total = time.perf_counter() - start
+    # Servers that don't report usage send roughly one token per chunk
+    tokens = usage_tokens if usage_tokens is not None else chunks
+    generating = total - (first_token or 0)
+    stats = {
+        "ttft_s": first_token,
+        "total_s": total,
+        "tokens": tokens,
+        "tokens_per_s": tokens / generating if generating > 0 else 0.0,
+        "finish_reason": finish_reason,
+    }
+    return text, stats
+
+
+# ---------------- BATCH REQUESTS ----------------
+def retry_delay(error, attempt):
+    """
+    Seconds to wait before retrying: the server's Retry-After when given,
+    else exponential backoff with jitter.
+    """
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return min(float(response.headers.get("retry-after")), BACKOFF_MAX_S)
+        except (TypeError, ValueError):
+            pass
+    return min(BACKOFF_BASE_S * 2 ** attempt, BACKOFF_MAX_S) * random.uniform(0.5, 1.0)
+
+
+class RateGate:
+    """
+    Concurrency limit shared by a batch. When any request is rate limited,
+    every worker holds off until the cool-down has passed instead of
+    hammering the API with requests that will fail too.
+    """
+
+    def __init__(self, concurrency):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.resume_at = 0.0
+
+    def cool_down(self, seconds):
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    async def wait(self):
+        while (delay := self.resume_at - time.monotonic()) > 0:
+            await asyncio.sleep(delay)
+
+
+async def chat_with_retries(client, gate, **request):
+    """
+    One chat completion through the gate, retried with backoff on
+    rate limits, 5xx responses, timeouts and connection errors.
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        await gate.wait()
+        try:
+            async with gate.semaphore:
+                response = await client.chat.completions.create(**request)
+            return response.choices[0].message.content
+        except openai.APIStatusError as e:
+            if e.status_code not in RETRY_STATUS or attempt == MAX_RETRIES:
+                raise
+            delay = retry_delay(e, attempt)
+            if e.status_code == 429:
+                gate.cool_down(delay)
+        except (openai.APIConnectionError, openai.APITimeoutError):
+            if attempt == MAX_RETRIES:
+                raise
+            delay = retry_delay(None, attempt)
+        await asyncio.sleep(delay)
+
+
+async def _run_batch(client, requests, concurrency, on_done):
+    gate = RateGate(concurrency)
+
+    async def run(index, request):
+        try:
+            result = await chat_with_retries(client, gate, **request)
+        except Exception as e:
+            # One failed request must not take the rest of the batch down
+            result = e
+        if on_done:
+            on_done(index, result)
+        return result
+
+    try:
+        return await asyncio.gather(*(run(i, request) for i, request in enumerate(requests)))
+    finally:
+        await client.close()
+
+
+def run_chat_batch(requests, concurrency=4, on_done=None, **client_options):
+    """
+    Run many chat completion requests (dicts of create() arguments)
+    concurrently on an AsyncOpenAI client, at most concurrency at a time.
+    on_done(index, result) is called as each finishes, on the calling
+    thread. Returns one result per request: the response text, or the
+    exception it finally failed with.
+    """
+    # Retries are handled here, so the client's own are switched off
+    client = openai.AsyncOpenAI(max_retries=0, **client_options)
+    return asyncio.run(_run_batch(client, requests, concurrency, on_done))
+
@@ -0,0 +1,214 @@
+"""
+Background e-mail delivery for the resume optimizer (builder.py).
+Must not import streamlit.
+
+Messages are queued and sent by one worker thread over SMTP connections
+kept open per (server, port, login), so a burst of messages pays the
+connect / STARTTLS / login cost once. Transient failures are retried with
+backoff; the page polls status() instead of waiting on the send.
+"""
+import hashlib
+import itertools
+import queue
+import smtplib
+import threading
+import time
+
+MAX_ATTEMPTS = 4
+RETRY_BASE_S = 2.0
+SMTP_TIMEOUT_S = 30
+# Servers drop idle sessions after a few minutes; close ours well before that
+IDLE_TIMEOUT_S = 60
+# Finished jobs are dropped once status() has reported them, or after this
+# long if nobody asks (the page that sent them was closed)
+FINISHED_TTL_S = 600
+
+# Failures that retrying won't fix
+PERMANENT_ERRORS = (
+    smtplib.SMTPAuthenticationError,
+    smtplib.SMTPNotSupportedError,
+)
+
+FINAL_STATUSES = ("sent", "failed")
+
+
+def is_permanent(error):
+    if isinstance(error, PERMANENT_ERRORS):
+        return True
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        # Refusals are temporary (450/451 greylisting...) only when every one is 4xx
+        codes = [code for code, _ in error.recipients.values()]
+        return not codes or any(not 400 <= code < 500 for code in codes)
+    # 5xx replies to MAIL FROM / DATA are permanent, 4xx are worth retrying
+    code = getattr(error, "smtp_code", None)
+    return isinstance(code, int) and code >= 500
+
+
+class MailQueue:
+    """
+    Queue of outgoing messages with per-job delivery status.
+    With starttls=False connections stay plain text, for local test servers.
+    """
+
+    def __init__(self, starttls=True):
+        self.starttls = starttls
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.jobs = {}
+        # connection key -> [smtplib.SMTP, last used]
+        self.connections = {}
+        self.worker = None
+
+    def submit(self, message, server, port, username, password):
+        """
+        Queue an email.message.Message for delivery. Returns a job id for status().
+        """
+        job_id = next(self.ids)
+        with self.lock:
+            self.jobs[job_id] = {
+                "id": job_id,
+                "recipient": message["To"],
+                "status": "queued",
+                "attempts": 0,
+                "error": None,
+                "updated": time.time(),
+            }
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="mail-queue", daemon=True)
+                self.worker.start()
+
+        self.queue.put((job_id, message, server, int(port), username, password))
+        return job_id
+
+    def status(self, job_id):
+        """
+        Copy of the job's status dict: status is queued, sending, retrying,
+        sent or failed; error holds the last failure.
+        A sent or failed job is reported once and then forgotten, so callers
+        keep the final status themselves. None for unknown job ids.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] in FINAL_STATUSES:
+                del self.jobs[job_id]
+            return dict(job)
+
+    def close(self):
+        """
+        Stop the worker once the queue is drained and close all connections.
+        """
+        if self.worker is not None:
+            self.queue.put(None)
+            self.worker.join()
+            self.worker = None
+
+    # ---------------- WORKER ----------------
+    def _update(self, job_id, **fields):
+        with self.lock:
+            self.jobs[job_id].update(fields, updated=time.time())
+
+    def _forget_finished(self):
+        cutoff = time.time() - FINISHED_TTL_S
+        with self.lock:
+            for job_id, job in list(self.jobs.items()):
+                if job["status"] in FINAL_STATUSES and job["updated"] < cutoff:
+                    del self.jobs[job_id]
+
+    def _run(self):
+        while True:
+            try:
+                job = self.queue.get(timeout=IDLE_TIMEOUT_S / 2)
+            except queue.Empty:
+                self._close_idle()
+                self._forget_finished()
+                continue
+            if job is None:
+                break
+            self._deliver(*job)
+            self._close_idle()
+            self._forget_finished()
+
+        for key in list(self.connections):
+            self._drop(key)
+
+    def _connect(self, server, port, username, password):
+        smtp = smtplib.SMTP(server, port, timeout=SMTP_TIMEOUT_S)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            if username:
+                smtp.login(username, password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+
+    def _drop(self, key):
+        smtp, _ = self.connections.pop(key, (None, None))
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except Exception:
+                smtp.close()
+
+    def _close_idle(self):
+        now = time.monotonic()
+        for key, (_, last_used) in list(self.connections.items()):
+            if now - last_used > IDLE_TIMEOUT_S:
+                self._drop(key)
+
+    def _send(self, message, server, port, username, password):
+        # The password is only part of the key as a hash
+        key = (server, port, username, hashlib.sha256((password or "").encode()).hexdigest())
+        reused = key in self.connections
+        if not reused:
+            self.connections[key] = [self._connect(server, port, username, password), time.monotonic()]
+
+        try:
+            self.connections[key][0].send_message(message)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            self._drop(key)
+            if not reused:
+                raise
+            # The pooled connection went stale; one fresh attempt right away
+            self.connections[key] = [self._connect(server, port, username, password), time.monotonic()]
+            self.connections[key][0].send_message(message)
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+            # smtplib resets the session after a rejection, so the connection
+            # stays usable unless the server is shutting it down (421)
+            if getattr(e, "smtp_code", None) == 421:
+                self._drop(key)
+            else:
+                self.connections[key][1] = time.monotonic()
+            raise
+        except Exception:
+            self._drop(key)
+            raise
+        self.connections[key][1] = time.monotonic()
+
+    def _deliver(self, job_id, message, server, port, username, password):
+        with self.lock:
+            attempts = self.jobs[job_id]["attempts"] + 1
+        self._update(job_id, status="sending", attempts=attempts)
+
+        try:
+            self._send(message, server, port, username, password)
+        except Exception as e:
+            if is_permanent(e) or attempts >= MAX_ATTEMPTS:
+                self._update(job_id, status="failed", error=str(e))
+                return
+            # Retried later from a timer so other messages aren't held up
+            self._update(job_id, status="retrying", error=str(e))
+            retry = threading.Timer(
+                RETRY_BASE_S * 2 ** (attempts - 1),
+                self.queue.put,
+                ((job_id, message, server, port, username, password),)
+            )
+            retry.daemon = True
+            retry.start()
+            return
+
+        self._update(job_id, status="sent", error=None)
@@ -0,0 +1,178 @@
+"""
+Headless OCR & rename, without Streamlit.
+
+Process a folder once:
+    python ocr_batch.py scans/ --workers 4
+
+Watch runtime/input and process PDFs as scanners drop them:
+    python ocr_batch.py --watch
+
+Uploads from the Streamlit app are staged in runtime/uploads, never in
+runtime/input, so a watcher does not pick them up.
+"""
+import argparse
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from ocr_pipeline import (
+    BASE_DIR,
+    CACHE_MAX_MB,
+    CPU_COUNT,
+    INPUT_DIR,
+    UPLOAD_DIR,
+    OutputNames,
+    RunJournal,
+    cache_evict,
+    ocr_jobs_per_file,
+    process_file,
+    stage_summary,
+    write_log,
+    write_metrics,
+)
+
+PROCESSED_DIR = BASE_DIR / "processed"
+
+
+def list_pdfs(folder):
+    return sorted(p for p in Path(folder).iterdir() if p.is_file() and p.suffix.lower() == ".pdf")
+
+
+def process_path(path, jobs=None, text_first=True, first_pages=0, journal=None, outputs=None,
+                 cache_mb=CACHE_MAX_MB):
+    # Files already in INPUT_DIR are OCR'd in place instead of being copied onto themselves
+    data = None if path.parent.resolve() == INPUT_DIR.resolve() else path.read_bytes()
+    return process_file(path.name, data, jobs, text_first, first_pages, journal, outputs, cache_mb)
+
+
+def print_row(row):
+    print(f"{row[1]} -> {row[4]} [{row[3]}, {row[5]}]", flush=True)
+
+
+def run_batch(folder, workers, text_first=True, first_pages=0, cache_mb=CACHE_MAX_MB, resume=False):
+    paths = list_pdfs(folder)
+    jobs = ocr_jobs_per_file(workers)
+    journal = RunJournal(resume=resume)
+    run_start = time.perf_counter()
+    results = [None] * len(paths)
+    outputs = OutputNames()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            futures = {
+                pool.submit(process_path, path, jobs, text_first, first_pages, journal, outputs, cache_mb): i
+                for i, path in enumerate(paths)
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                row = future.result()
+                results[futures[future]] = row
+                print(f"[{done}/{len(paths)}] ", end="")
+                print_row(row)
+        except BaseException:
+            # Ctrl+C: let running files finish, leave the queued ones to --resume
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    write_log(results)
+    journal.complete()
+    write_metrics(results, time.perf_counter() - run_start)
+    cache_evict(cache_mb)
+
+    for stage in stage_summary(results):
+        print(f"{stage['stage']:>8}: p50 {stage['p50_s']:.3f}s  p95 {stage['p95_s']:.3f}s  ({stage['files']} files)")
+    return results
+
+
+def watch(folder, workers, text_first=True, first_pages=0, cache_mb=CACHE_MAX_MB, interval=5.0):
+    """
+    Poll folder and process each PDF once its size has stopped changing
+    between two polls, so half-written scans are not picked up.
+    Processed sources are moved to runtime/processed; log rows are
+    appended to rename_log.csv as files finish.
+    A file that vanishes, can't be read or can't be moved is reported and
+    skipped; the watcher keeps going.
+    """
+    PROCESSED_DIR.mkdir(parents=True, exist_ok=True)
+    jobs = ocr_jobs_per_file(workers)
+    sizes = {}
+    in_flight = {}
+    # Files that failed or could not be moved away, by their size then;
+    # left alone until they change or go
+    stuck = {}
+    outputs = OutputNames()
+
+    print(f"Watching {folder} with {workers} workers (Ctrl+C to stop)", flush=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            for path in list_pdfs(folder):
+                if path in in_flight:
+                    continue
+                try:
+                    size = path.stat().st_size
+                except OSError:
+                    # Removed or renamed since it was listed
+                    sizes.pop(path, None)
+                    stuck.pop(path, None)
+                    continue
+                if stuck.get(path) == size:
+                    continue
+                stuck.pop(path, None)
+                if sizes.get(path) == size:
+                    in_flight[path] = pool.submit(
+                        process_path, path, jobs, text_first, first_pages, outputs=outputs, cache_mb=cache_mb
+                    )
+                    del sizes[path]
+                else:
+                    sizes[path] = size
+
+            finished = [path for path, future in in_flight.items() if future.done()]
+            for path in finished:
+                try:
+                    row = in_flight.pop(path).result()
+                    write_log([row], append=True)
+                    print_row(row)
+                    shutil.move(str(path), PROCESSED_DIR / path.name)
+                except OSError as e:
+                    print(f"{path.name}: skipped until it changes, {e}", flush=True)
+                    try:
+                        stuck[path] = path.stat().st_size
+                    except OSError:
+                        pass
+
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless OCR & rename for scanned shipment PDFs")
+    parser.add_argument("folder", nargs="?", help="Folder of PDFs to process once")
+    parser.add_argument("--watch", action="store_true", help="Keep watching the folder (default runtime/input)")
+    parser.add_argument("--workers", type=int, default=min(4, CPU_COUNT), help="Files processed in parallel")
+    parser.add_argument("--first-pages", type=int, default=1, help="OCR first pages only (0 = all pages)")
+    parser.add_argument("--no-text-layer", action="store_true", help="Always OCR, even when the PDF has a text layer")
+    parser.add_argument("--cache-mb", type=int, default=CACHE_MAX_MB, help="OCR cache size (MB)")
+    parser.add_argument("--resume", action="store_true", help="Skip files completed by an interrupted run")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between folder polls in --watch mode")
+    args = parser.parse_args()
+
+    workers = max(1, args.workers)
+    options = dict(text_first=not args.no_text_layer, first_pages=args.first_pages, cache_mb=args.cache_mb)
+
+    folder = Path(args.folder or INPUT_DIR)
+    if folder.resolve() == UPLOAD_DIR.resolve():
+        parser.error(f"{UPLOAD_DIR} holds the app's uploads in progress, not scans to process")
+
+    if args.watch:
+        try:
+            watch(folder, workers, interval=args.interval, **options)
+        except KeyboardInterrupt:
+            pass
+    elif args.folder:
+        run_batch(folder, workers, resume=args.resume, **options)
+    else:
+        parser.error("give a folder to process, or --watch")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,545 @@
+"""
+Shared OCR & rename pipeline used by the Streamlit app (app.py) and the
+headless batch runner (ocr_batch.py). Must not import streamlit.
+"""
+import pdfplumber
+import os
+import re
+import csv
+import json
+import hashlib
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import datetime
+
+from id_extractor import DEFAULT_RULES, IdExtractor, load_rules
+from shared_resources import dir_size
+
+# ---------------- CONFIG ----------------
+# ocrmypdf writes this placeholder to the sidecar for pages left out by --pages
+OCR_SKIPPED_REGEX = re.compile(r"^\[OCR skipped on page.*\]$", re.MULTILINE)
+
+BASE_DIR = Path("runtime")
+# Dropped by scanners and watched by ocr_batch.py --watch
+INPUT_DIR = BASE_DIR / "input"
+# Uploads staged by process_file; kept apart from INPUT_DIR so the watcher never takes them
+UPLOAD_DIR = BASE_DIR / "uploads"
+OUTPUT_DIR = BASE_DIR / "output"
+TMP_DIR = BASE_DIR / "tmp"
+CACHE_DIR = BASE_DIR / "cache"
+
+for d in [INPUT_DIR, UPLOAD_DIR, OUTPUT_DIR, TMP_DIR, CACHE_DIR]:
+    d.mkdir(parents=True, exist_ok=True)
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Anything that changes the OCR output must be part of the cache key
+OCR_SETTINGS = "ocrmypdf --force-ocr"
+CACHE_MAX_MB = 2048
+# Cache column of files processed in this run (HIT/MISS: OCR cache,
+# TEXT: existing text layer used, no OCR); RESUMED and errors are not
+TIMED_STATUSES = ("HIT", "MISS", "TEXT")
+
+ZIP_PATH = BASE_DIR / "renamed_pdfs.zip"
+LOG_PATH = OUTPUT_DIR / "rename_log.csv"
+JOURNAL_PATH = BASE_DIR / "journal.jsonl"
+METRICS_PATH = BASE_DIR / "metrics.prom"
+
+# Timed stages per file, in pipeline order. "extract" includes streaming the sidecar.
+STAGES = ("write", "probe", "ocr", "extract", "copy", "zip")
+LOG_HEADER = (
+    ["timestamp", "original_file", "extracted_id", "rule", "output_file", "status", "cache"]
+    + ["pages", "input_bytes", "output_bytes"]
+    + [f"{stage}_s" for stage in STAGES]
+)
+
+# Optional override of the keyword scoring rules, see id_extractor.load_rules
+RULES_FILE = BASE_DIR / "id_rules.json"
+ID_EXTRACTOR = IdExtractor(load_rules(RULES_FILE) if RULES_FILE.exists() else DEFAULT_RULES)
+
+
+# ---------------- HELPERS ----------------
+def extract_best_id(text):
+    return ID_EXTRACTOR.extract_text(text)
+
+
+def read_text_layer(pdf_path):
+    """
+    Cheap pre-flight read of the PDF's existing text layer.
+    Returns "" for image-only scans or unreadable files.
+    """
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            return "\n".join(page.extract_text() or "" for page in pdf.pages)
+    except Exception:
+        return ""
+
+
+def ocr_jobs_per_file(workers):
+    # Split the cores between files running side by side and ocrmypdf's own page workers
+    return max(1, CPU_COUNT // max(1, workers))
+
+
+def count_pages(pdf_path):
+    """
+    Returns 0 when the PDF cannot be parsed; ocrmypdf may still repair it.
+    """
+    try:
+        with pdfplumber.open(pdf_path) as pdf:
+            return len(pdf.pages)
+    except Exception:
+        return 0
+
+
+@contextmanager
+def timed(timings, stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+
+def run_ocr(input_pdf, out_pdf, txt_file, jobs=None, pages=None):
+    cmd = [
+        "ocrmypdf",
+        "--force-ocr",
+        "--sidecar", str(txt_file),
+    ]
+    if jobs:
+        cmd += ["--jobs", str(jobs)]
+    if pages:
+        cmd += ["--pages", pages]
+    cmd += [str(input_pdf), str(out_pdf)]
+    subprocess.run(cmd, check=True)
+
+
+def read_sidecar(txt_file):
+    return OCR_SKIPPED_REGEX.sub("", txt_file.read_text(errors="ignore"))
+
+
+def staged_ocr(input_path, jobs=None, first_pages=0, total_pages=0, timings=None):
+    """
+    OCR only the first pages and escalate to the rest of the document
+    when they give no SHIPMENT/REFERENCE match.
+    Returns (ocr_pdf, txt_file, extracted_id, rule).
+    """
+    timings = {} if timings is None else timings
+    ocr_pdf = TMP_DIR / f"{input_path.stem}_ocr.pdf"
+    txt_file = TMP_DIR / f"{input_path.stem}.txt"
+
+    if not first_pages or total_pages <= first_pages:
+        with timed(timings, "ocr"):
+            run_ocr(input_path, ocr_pdf, txt_file, jobs)
+        with timed(timings, "extract"):
+            extracted_id, rule = ID_EXTRACTOR.extract_file(txt_file)
+        return ocr_pdf, txt_file, extracted_id, f"OCR:{rule}"
+
+    # Pages outside --pages are passed through, so the output is still the full document
+    with timed(timings, "ocr"):
+        run_ocr(input_path, ocr_pdf, txt_file, jobs, pages=f"1-{first_pages}")
+    with timed(timings, "extract"):
+        text = read_sidecar(txt_file)
+        extracted_id, rule = extract_best_id(text)
+    if rule in ("SHIPMENT", "REFERENCE"):
+        return ocr_pdf, txt_file, extracted_id, f"OCR[1-{first_pages}]:{rule}"
+
+    # Escalate: OCR the remaining pages on top of the partially OCR'd PDF
+    full_pdf = TMP_DIR / f"{input_path.stem}_ocr_full.pdf"
+    rest_txt = TMP_DIR / f"{input_path.stem}_rest.txt"
+    with timed(timings, "ocr"):
+        run_ocr(ocr_pdf, full_pdf, rest_txt, jobs, pages=f"{first_pages + 1}-{total_pages}")
+
+    with timed(timings, "extract"):
+        text = text + "\n" + read_sidecar(rest_txt)
+        txt_file.write_text(text)
+        extracted_id, rule = extract_best_id(text)
+    return full_pdf, txt_file, extracted_id, f"OCR:{rule}"
+
+
+# ---------------- OCR CACHE ----------------
+def cache_key(input_hash, first_pages=0):
+    settings = f"{OCR_SETTINGS} first_pages={first_pages} rules={ID_EXTRACTOR.fingerprint}"
+    return hashlib.sha256(f"{input_hash} {settings}".encode()).hexdigest()
+
+
+def cache_lookup(key):
+    """
+    Returns (cache_entry_dir, result dict) or None on a miss.
+    """
+    entry = CACHE_DIR / key
+    try:
+        result = json.loads((entry / "result.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+    # Touch the entry so LRU eviction sees it as recently used
+    os.utime(entry)
+    return entry, result
+
+
+def cache_store(key, ocr_pdf, txt_file, extracted_id, rule):
+    entry = CACHE_DIR / key
+    staging = Path(tempfile.mkdtemp(dir=CACHE_DIR, prefix=".staging_"))
+
+    shutil.copy2(ocr_pdf, staging / "ocr.pdf")
+    shutil.copy2(txt_file, staging / "sidecar.txt")
+    (staging / "result.json").write_text(
+        json.dumps({"extracted_id": extracted_id, "rule": rule})
+    )
+
+    # Publish atomically; another worker may have stored the same PDF first
+    try:
+        staging.rename(entry)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+_evict_lock = threading.Lock()
+
+
+def cache_evict(max_mb=CACHE_MAX_MB):
+    """
+    Drop least recently used entries until the cache fits in max_mb.
+    Called after every store, so parallel workers take turns.
+    """
+    with _evict_lock:
+        entries = [e for e in CACHE_DIR.iterdir() if e.is_dir() and not e.name.startswith(".")]
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        sizes = {e: dir_size(e) for e in entries}
+        total = sum(sizes.values())
+
+        for entry in entries:
+            if total <= max_mb * 1024 * 1024:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= sizes[entry]
+
+
+# ---------------- RUN JOURNAL ----------------
+def run_settings(text_first=True, first_pages=0):
+    """
+    Fingerprint of everything that decides a file's result, so a journal
+    entry is only reused by a run with the same settings.
+    """
+    settings = f"{OCR_SETTINGS} text_first={text_first} first_pages={first_pages} rules={ID_EXTRACTOR.fingerprint}"
+    return hashlib.sha256(settings.encode()).hexdigest()[:16]
+
+
+class RunJournal:
+    """
+    Append-only JSON-lines record of finished files, flushed to disk after
+    every file so an interrupted run can pick up where it stopped.
+    With resume=False the previous journal is discarded; complete()
+    empties it once a run has finished.
+    """
+
+    def __init__(self, path=JOURNAL_PATH, resume=True):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = {}
+
+        if resume and path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Last line may be cut short by the crash we are resuming from
+                        continue
+                    # Entries written before settings were recorded never match
+                    self.done[(entry["file"], entry["sha256"], entry.get("settings"))] = entry["row"]
+                # Start new entries on a fresh line after a cut-short one
+                f.seek(0, os.SEEK_END)
+                if f.tell() and not line.endswith("\n"):
+                    with open(path, "a", encoding="utf-8") as out:
+                        out.write("\n")
+        else:
+            path.write_text("")
+
+    def lookup(self, name, input_hash, settings):
+        """
+        Returns the journalled row if this exact file was already renamed
+        with the same run_settings and its output is still there, else None.
+        Errors, and rows journalled with an older LOG_HEADER, are redone.
+        """
+        row = self.done.get((name, input_hash, settings))
+        if not row or len(row) != len(LOG_HEADER):
+            return None
+        if row[3] == "ERROR" or not (OUTPUT_DIR / row[4]).exists():
+            return None
+        return row[:6] + ["RESUMED"] + row[7:]
+
+    def record(self, name, input_hash, settings, row):
+        entry = {"file": name, "sha256": input_hash, "settings": settings, "output_file": row[4], "row": row}
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.done[(name, input_hash, settings)] = row
+
+    def complete(self):
+        """
+        The run finished: nothing is left to resume, so later runs start fresh.
+        """
+        with self.lock:
+            self.path.write_text("")
+            self.done = {}
+
+
+class OutputNames:
+    """
+    Output file names handed out during one run, so files that extract
+    the same ID get a numeric suffix (S123.pdf, S123_2.pdf) instead of
+    overwriting each other in OUTPUT_DIR while they are being zipped.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.used = set()
+
+    def claim(self, name):
+        """
+        Returns name, or name with the first free suffix, and marks it used.
+        """
+        stem, ext = os.path.splitext(name)
+        with self.lock:
+            unique, n = name, 1
+            while unique in self.used:
+                n += 1
+                unique = f"{stem}_{n}{ext}"
+            self.used.add(unique)
+            return unique
+
+    def reserve(self, name):
+        """
+        Marks exactly this name used; False if another file already has it.
+        """
+        with self.lock:
+            if name in self.used:
+                return False
+            self.used.add(name)
+            return True
+
+
+def open_output_zip(path, level=0):
+    """
+    PDFs are already compressed, so level 0 stores them as-is;
+    1-9 deflates at that level.
+    """
+    if level:
+        return zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=level)
+    return zipfile.ZipFile(path, "w", zipfile.ZIP_STORED)
+
+
+def make_row(name, extracted_id, rule, out_name, status, cache_status, pages=0, input_bytes=0, output_bytes=0, timings=None):
+    timings = timings or {}
+    return [
+        datetime.now().isoformat(),
+        name,
+        extracted_id or "",
+        rule,
+        out_name,
+        status,
+        cache_status,
+        pages,
+        input_bytes,
+        output_bytes,
+    ] + [round(timings.get(stage, 0.0), 4) for stage in STAGES]
+
+
+def set_stage_time(row, stage, seconds):
+    row[LOG_HEADER.index(f"{stage}_s")] = round(seconds, 4)
+
+
+def process_file(name, data=None, jobs=None, text_first=True, first_pages=0, journal=None, outputs=None,
+                 cache_mb=CACHE_MAX_MB):
+    """
+    OCR, extract and rename a single PDF.
+    data is the upload's bytes, staged in UPLOAD_DIR; None means the file
+    is already in INPUT_DIR.
+    Files already completed in the journal are skipped.
+    outputs is the run's OutputNames, shared by every file of the run.
+    New OCR results are cached, keeping the cache within cache_mb.
+    Returns one rename_log.csv row, including per-stage timings.
+    """
+    uploaded = data is not None
+    input_path = (UPLOAD_DIR if uploaded else INPUT_DIR) / name
+    input_hash = None
+    outputs = outputs or OutputNames()
+    settings = run_settings(text_first, first_pages)
+    timings = {}
+    pages = 0
+    try:
+        if not uploaded:
+            data = input_path.read_bytes()
+        input_hash = hashlib.sha256(data).hexdigest()
+
+        previous = journal.lookup(name, input_hash, settings) if journal else None
+        # Redone if a file of this run already took its output name
+        if previous and outputs.reserve(previous[4]):
+            return previous
+
+        if uploaded:
+            with timed(timings, "write"):
+                with open(input_path, "wb") as f:
+                    f.write(data)
+
+        with timed(timings, "probe"):
+            pages = count_pages(input_path)
+
+        key = cache_key(input_hash, first_pages)
+        cached = cache_lookup(key)
+
+        if cached:
+            entry, result = cached
+            ocr_pdf = entry / "ocr.pdf"
+            extracted_id, rule = result["extracted_id"], result["rule"]
+            cache_status = "HIT"
+        else:
+            extracted_id, rule = None, "UNMATCHED"
+            if text_first:
+                with timed(timings, "probe"):
+                    extracted_id, rule = extract_best_id(read_text_layer(input_path))
+
+            if rule in ("SHIPMENT", "REFERENCE"):
+                # Digital or already OCR'd PDF: the existing text layer is good enough
+                ocr_pdf = input_path
+                rule = f"TEXT:{rule}"
+                cache_status = "TEXT"
+            else:
+                ocr_pdf, txt_file, extracted_id, rule = staged_ocr(
+                    input_path, jobs, first_pages, pages, timings
+                )
+                cache_store(key, ocr_pdf, txt_file, extracted_id, rule)
+                cache_evict(cache_mb)
+                cache_status = "MISS"
+
+        if extracted_id:
+            out_name = outputs.claim(f"{extracted_id}.pdf")
+            status = "OK"
+        else:
+            out_name = outputs.claim(f"UNMATCHED_{name}")
+            status = "UNMATCHED"
+
+        with timed(timings, "copy"):
+            shutil.copy2(ocr_pdf, OUTPUT_DIR / out_name)
+
+        row = make_row(
+            name, extracted_id, rule, out_name, status, cache_status,
+            pages, len(data), (OUTPUT_DIR / out_name).stat().st_size, timings
+        )
+
+    except Exception as e:
+        out_name = outputs.claim(f"ERROR_{name}")
+        shutil.copy2(input_path, OUTPUT_DIR / out_name)
+        row = make_row(
+            name, None, "ERROR", out_name, str(e), "",
+            pages, len(data or b""), 0, timings
+        )
+
+    if journal and input_hash:
+        journal.record(name, input_hash, settings, row)
+    return row
+
+
+def write_log(rows, path=LOG_PATH, append=False):
+    new_file = not append or not path.exists()
+    with open(path, "a" if append else "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(LOG_HEADER)
+        writer.writerows(rows)
+
+
+# ---------------- METRICS ----------------
+def percentile(values, q):
+    """
+    Nearest-rank percentile, q in [0, 100].
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def stage_summary(rows):
+    """
+    p50/p95/total seconds per stage over the files that actually ran it.
+    Resumed and errored files are left out.
+    """
+    timed_rows = [r for r in rows if r[6] in TIMED_STATUSES and len(r) == len(LOG_HEADER)]
+    summary = []
+    for stage in STAGES:
+        col = LOG_HEADER.index(f"{stage}_s")
+        values = [float(r[col]) for r in timed_rows if float(r[col]) > 0]
+        summary.append({
+            "stage": stage,
+            "files": len(values),
+            "p50_s": round(percentile(values, 50), 4),
+            "p95_s": round(percentile(values, 95), 4),
+            "total_s": round(sum(values), 4),
+        })
+    return summary
+
+
+def write_metrics(rows, wall_seconds, path=METRICS_PATH):
+    """
+    Write the last run's metrics in Prometheus text format, e.g. for the
+    node_exporter textfile collector. Replaced atomically so a scrape never
+    sees a half-written file.
+    """
+    # Resumed rows were timed in an earlier run, so they do not count towards throughput
+    timed_rows = [r for r in rows if r[6] in TIMED_STATUSES and len(r) == len(LOG_HEADER)]
+    pages = sum(int(r[7]) for r in timed_rows)
+    lines = [
+        "# HELP ocr_renamer_stage_seconds Per-file time spent in each pipeline stage in the last run.",
+        "# TYPE ocr_renamer_stage_seconds summary",
+    ]
+    for stage in stage_summary(rows):
+        label = f'stage="{stage["stage"]}"'
+        lines += [
+            f'ocr_renamer_stage_seconds{{{label},quantile="0.5"}} {stage["p50_s"]}',
+            f'ocr_renamer_stage_seconds{{{label},quantile="0.95"}} {stage["p95_s"]}',
+            f"ocr_renamer_stage_seconds_sum{{{label}}} {stage['total_s']}",
+            f"ocr_renamer_stage_seconds_count{{{label}}} {stage['files']}",
+        ]
+
+    statuses = {}
+    for r in rows:
+        status = r[5] if r[3] != "ERROR" else "ERROR"
+        statuses[status] = statuses.get(status, 0) + 1
+    lines += [
+        "# HELP ocr_renamer_files Files in the last run by status.",
+        "# TYPE ocr_renamer_files gauge",
+    ] + [f'ocr_renamer_files{{status="{k}"}} {v}' for k, v in sorted(statuses.items())]
+
+    lines += [
+        "# HELP ocr_renamer_pages Pages in the last run.",
+        "# TYPE ocr_renamer_pages gauge",
+        f"ocr_renamer_pages {pages}",
+        "# HELP ocr_renamer_input_bytes Input bytes in the last run.",
+        "# TYPE ocr_renamer_input_bytes gauge",
+        f"ocr_renamer_input_bytes {sum(int(r[8]) for r in timed_rows)}",
+        "# HELP ocr_renamer_run_seconds Wall time of the last run.",
+        "# TYPE ocr_renamer_run_seconds gauge",
+        f"ocr_renamer_run_seconds {round(wall_seconds, 4)}",
+        "# HELP ocr_renamer_pages_per_second Pages per second of wall time in the last run.",
+        "# TYPE ocr_renamer_pages_per_second gauge",
+        f"ocr_renamer_pages_per_second {round(pages / wall_seconds, 4) if wall_seconds else 0}",
+        "# HELP ocr_renamer_last_run_timestamp_seconds When the last run finished.",
+        "# TYPE ocr_renamer_last_run_timestamp_seconds gauge",
+        f"ocr_renamer_last_run_timestamp_seconds {round(time.time(), 3)}",
+    ]
+
+    tmp = path.with_suffix(".prom.tmp")
+    tmp.write_text("\n".join(lines) + "\n")
+    os.replace(tmp, path)
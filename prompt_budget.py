@@ -0,0 +1,230 @@
+"""
+Prompt compaction and token budgeting for the resume optimizer (builder.py).
+Must not import streamlit.
+
+Resume and JD text is normalised (hyphenation breaks, whitespace runs,
+page numbers, running page headers / footers) before it is sent. When the request would
+still go over the input budget, the JD is cut down to its relevant
+sections. Output max_tokens is sized from the resume instead of fixed.
+"""
+import functools
+import math
+import re
+
+# Optional exact token counts: pip install tiktoken
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+INPUT_TOKEN_BUDGET = 6000
+MIN_JD_TOKENS = 300
+
+# Output is a rewrite of the resume, so it is sized from the resume
+OUTPUT_TOKEN_RATIO = 1.3
+OUTPUT_TOKEN_MARGIN = 300
+MIN_OUTPUT_TOKENS = 1000
+MAX_OUTPUT_TOKENS = 4000
+
+# Rough size of text when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+HYPHEN_BREAK = re.compile(r"([a-z])-\n([a-z])")
+SPACE_RUN = re.compile(r"[ \t\f\v\u00A0]+")
+BLANK_RUN = re.compile(r"\n{3,}")
+# "Page 3", "Page 3 of 4", "3 of 4", "3/4"; a bare number may be a year or a GPA
+PAGE_NUMBER = re.compile(r"^(page\s*\d+(\s*(of|/)\s*\d+)?|\d+\s*(of|/)\s*\d+)$", re.IGNORECASE)
+
+# Pages are separated by form feeds (see builder.extract_text_from_pdf).
+# Only the first / last EDGE_LINES lines of a page can be a running
+# header or footer, and only when short and repeated on several pages.
+PAGE_BREAK = "\f"
+EDGE_LINES = 2
+MAX_RUNNING_LINE = 80
+MIN_RUNNING_PAGES = 2
+
+# JD sections worth keeping, and boilerplate dropped first when over budget
+RELEVANT_SECTION = re.compile(
+    r"responsib|requirement|qualif|skill|experience|what you|you will|you'll|"
+    r"duties|must|nice to have|preferred|bonus|tech|stack|tools|about the (job|role|position)|the role",
+    re.IGNORECASE,
+)
+BOILERPLATE_SECTION = re.compile(
+    r"benefit|perk|about us|about the company|who we are|our (culture|values|mission|story)|"
+    r"equal opportunit|eeo|diversity|salary|compensation|pay range|how to apply|privacy|"
+    r"disclaimer|accommodation|why join",
+    re.IGNORECASE,
+)
+
+
+# ---------------- TOKENS ----------------
+@functools.lru_cache(maxsize=None)
+def get_encoding(model):
+    """
+    tiktoken encoding for model, or None when tiktoken or its encoding
+    files are unavailable (they are downloaded on first use).
+    """
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text, model):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text, max_tokens, model):
+    """
+    First max_tokens of text, cut back to the last full line when there is one.
+    """
+    encoding = get_encoding(model)
+    if encoding is None:
+        cut = text[:max_tokens * CHARS_PER_TOKEN]
+    else:
+        cut = encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+    if len(cut) < len(text) and "\n" in cut:
+        cut = cut[:cut.rindex("\n")]
+    return cut
+
+
+# ---------------- TEXT ----------------
+def page_edges(lines):
+    """
+    Indexes of the first and last EDGE_LINES non-empty lines of a page.
+    """
+    filled = [i for i, line in enumerate(lines) if line]
+    return set(filled[:EDGE_LINES] + filled[-EDGE_LINES:])
+
+
+def normalize_text(text):
+    """
+    Join words hyphenated across line breaks, collapse whitespace runs and
+    drop page numbers plus repeats of short lines found at the top or
+    bottom of several pages (running headers / footers). Text without page breaks
+    only loses page numbers; repeated lines elsewhere are content.
+    """
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = HYPHEN_BREAK.sub(r"\1\2", text)
+
+    pages = [
+        [SPACE_RUN.sub(" ", line).strip() for line in page.split("\n")]
+        for page in text.split(PAGE_BREAK)
+    ]
+
+    # Count each short edge line once per page it appears on
+    edge_counts = {}
+    for page in pages:
+        keys = {page[i].lower() for i in page_edges(page) if len(page[i]) <= MAX_RUNNING_LINE}
+        for key in keys:
+            edge_counts[key] = edge_counts.get(key, 0) + 1
+    running = {key for key, count in edge_counts.items() if count >= MIN_RUNNING_PAGES}
+
+    # The first copy stays: a running header is often the name and contact line
+    lines = []
+    kept = set()
+    for page in pages:
+        edges = page_edges(page)
+        for i, line in enumerate(page):
+            if line and PAGE_NUMBER.match(line):
+                continue
+            key = line.lower()
+            if i in edges and key in running:
+                if key in kept:
+                    continue
+                kept.add(key)
+            lines.append(line)
+
+    return BLANK_RUN.sub("\n\n", "\n".join(lines)).strip()
+
+
+def is_heading(line):
+    """
+    Short line ending in a colon, or a short title-like line without a full stop.
+    """
+    if not line or len(line) > 60:
+        return False
+    if line.endswith(":"):
+        return True
+    words = line.split()
+    return len(words) <= 6 and not line.endswith(".") and (line.isupper() or line.istitle())
+
+
+def split_sections(text):
+    """
+    [(heading, text)] where the first section may have an empty heading.
+    """
+    sections = [["", []]]
+    for line in text.split("\n"):
+        if is_heading(line.strip()):
+            sections.append([line.strip(), [line]])
+        else:
+            sections[-1][1].append(line)
+    sections = [(heading, "\n".join(lines).strip()) for heading, lines in sections]
+    return [(heading, body) for heading, body in sections if body]
+
+
+def trim_job_description(text, max_tokens, model):
+    """
+    Fit a JD into max_tokens: drop boilerplate sections (benefits, about us,
+    EEO...), then anything not about the role itself except the untitled
+    intro, and finally cut the remainder off at the budget.
+    """
+    if count_tokens(text, model) <= max_tokens:
+        return text
+
+    sections = [s for s in split_sections(text) if not BOILERPLATE_SECTION.search(s[0])]
+    trimmed = "\n\n".join(body for _, body in sections)
+    if count_tokens(trimmed, model) > max_tokens:
+        relevant = [s for s in sections if not s[0] or RELEVANT_SECTION.search(s[0])]
+        # A JD without recognisable headings is kept whole for truncation
+        if relevant:
+            trimmed = "\n\n".join(body for _, body in relevant)
+
+    return truncate_tokens(trimmed, max_tokens, model)
+
+
+# ---------------- BUDGET ----------------
+def estimate_output_tokens(resume_tokens):
+    estimate = round(resume_tokens * OUTPUT_TOKEN_RATIO) + OUTPUT_TOKEN_MARGIN
+    return max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, estimate))
+
+
+def fit_prompt(system_prompt, cv_text, job_description, build_prompt, model, budget=INPUT_TOKEN_BUDGET):
+    """
+    Normalise both texts and trim the JD until system prompt plus
+    build_prompt(cv_text, job_description) fit in budget input tokens.
+    The resume is never trimmed; the JD keeps at least MIN_JD_TOKENS.
+    Returns (user prompt, max_tokens, token counts dict).
+    """
+    cv_text = normalize_text(cv_text)
+    job_description = normalize_text(job_description)
+
+    system_tokens = count_tokens(system_prompt, model)
+    resume_tokens = count_tokens(cv_text, model)
+    jd_tokens = count_tokens(job_description, model)
+    template_tokens = count_tokens(build_prompt("", ""), model)
+
+    jd_budget = max(MIN_JD_TOKENS, budget - system_tokens - resume_tokens - template_tokens)
+    if jd_tokens > jd_budget:
+        job_description = trim_job_description(job_description, jd_budget, model)
+
+    user_prompt = build_prompt(cv_text, job_description)
+    counts = {
+        "system": system_tokens,
+        "resume": resume_tokens,
+        "jd": count_tokens(job_description, model),
+        "jd_original": jd_tokens,
+        "input": system_tokens + count_tokens(user_prompt, model),
+        "budget": budget,
+        "max_tokens": estimate_output_tokens(resume_tokens),
+        "exact": get_encoding(model) is not None,
+    }
+    return user_prompt, counts["max_tokens"], counts
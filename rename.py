@@ -1,49 +1,62 @@
 import streamlit as st
-import pdfplumber
-import pytesseract
-import re
 import io
+import os
+import hashlib
+import zipfile
 import pandas as pd
+from collections import OrderedDict
 
+from image_preprocess import PREPROCESS_STEPS
+from smo_ocr import REFINE_BELOW, available_backends, extract_smo_via_ocr_with_confidence
 
-def extract_smo_via_ocr_with_confidence(pdf_file):
-    """
-    OCR-only extraction for scanned PDFs.
-    Returns (SMO_REFERENCE, confidence%)
-    """
+# OCR results kept per session; each entry is a small tuple, so the count bounds memory
+OCR_CACHE_MAX_ENTRIES = 500
 
-    best_match = None
-    best_confidence = 0
 
-    with pdfplumber.open(pdf_file) as pdf:
-        for page in pdf.pages:
-            image = page.to_image(resolution=300).original
-
-            # OCR with confidence data
-            ocr_data = pytesseract.image_to_data(
-                image, output_type=pytesseract.Output.DATAFRAME
-            )
+# ---------------- HELPERS ----------------
+def cached_ocr(uploaded_file, workers=1, **ocr_params):
+    """
+    Memoize OCR results in the session, keyed on the file's content hash
+    and the OCR parameters, so reruns (e.g. download clicks) don't re-OCR.
+    workers only sets the parallelism, so it is left out of the key.
+    Least recently used entries are evicted past OCR_CACHE_MAX_ENTRIES.
+    Returns (SMO_REFERENCE, confidence, dpi, stats) where stats holds the
+    pages OCR'd and the seconds the original OCR run took.
+    """
+    cache = st.session_state.setdefault("ocr_cache", OrderedDict())
+    digest = hashlib.sha256(uploaded_file.getbuffer()).hexdigest()
+    key = (digest, tuple(sorted(ocr_params.items())))
 
-            # Drop empty rows
-            ocr_data = ocr_data.dropna(subset=["text", "conf"])
+    if key in cache:
+        cache.move_to_end(key)
+        return cache[key]
 
-            # Normalize text
-            ocr_data["clean_text"] = (
-                ocr_data["text"].astype(str).str.upper().str.replace(" ", "")
-            )
+    stats = {}
+    result = extract_smo_via_ocr_with_confidence(uploaded_file, workers, stats=stats, **ocr_params)
+    result = (*result, stats)
+    cache[key] = result
+    while len(cache) > OCR_CACHE_MAX_ENTRIES:
+        cache.popitem(last=False)
+    return result
 
-            for _, row in ocr_data.iterrows():
-                match = re.search(r"SMO[A-Z0-9]+", row["clean_text"])
-                if match:
-                    conf = float(row["conf"])
-                    if conf > best_confidence:
-                        best_match = match.group(0)
-                        best_confidence = conf
 
-    if best_match:
-        return best_match, round(best_confidence, 2)
-
-    return None, None
+def build_renamed_zip(renamed):
+    """
+    renamed: list of (file_name, pdf_bytes). Returns ZIP bytes.
+    PDFs are stored as-is; repeated names get a numeric suffix.
+    """
+    buffer = io.BytesIO()
+    used = set()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as zipf:
+        for name, data in renamed:
+            stem, ext = os.path.splitext(name)
+            unique, n = name, 1
+            while unique in used:
+                n += 1
+                unique = f"{stem}_{n}{ext}"
+            used.add(unique)
+            zipf.writestr(unique, data)
+    return buffer.getvalue()
 
 
 # ---------------- STREAMLIT UI ----------------
@@ -61,6 +74,54 @@ st.write(
     "supports **bulk uploads**, and shows **confidence scores**."
 )
 
+with st.sidebar:
+    st.header("⚙️ OCR Settings")
+    ocr_backend = st.selectbox(
+        "OCR engine",
+        available_backends(),
+        help="tesserocr keeps tesseract loaded in-process instead of starting it for every page"
+    )
+    page_workers = st.number_input(
+        "Pages OCR'd in parallel",
+        min_value=1,
+        max_value=os.cpu_count() or 1,
+        value=min(4, os.cpu_count() or 1),
+        help="Pages are rendered and OCR'd on a process pool; 1 runs them in sequence"
+    )
+    stop_confidence = st.slider(
+        "Stop at confidence (%)",
+        min_value=0,
+        max_value=100,
+        value=90,
+        help="Skip the remaining pages once a match reaches this confidence; 0 always OCRs every page"
+    )
+    coarse_dpi = st.select_slider(
+        "First-pass DPI",
+        options=[100, 150, 200, 300],
+        value=150,
+        help="Pages are OCR'd at this resolution first"
+    )
+    fine_dpi = st.select_slider(
+        "Re-OCR DPI",
+        options=[300, 400, 600],
+        value=300,
+        help="Resolution used when the first pass finds nothing or is not confident enough"
+    )
+    refine_below = st.slider(
+        "Re-OCR below confidence (%)",
+        min_value=0,
+        max_value=100,
+        value=REFINE_BELOW,
+        help="Pages whose best first-pass match is under this confidence are OCR'd again at the higher DPI"
+    )
+    preprocess = st.multiselect(
+        "Image preprocessing",
+        PREPROCESS_STEPS,
+        default=[],
+        help="Clean up noisy grey scans before tesseract: grayscale, adaptive threshold, "
+             "despeckle, deskew and blank-margin crop"
+    )
+
 uploaded_files = st.file_uploader(
     "Upload one or more scanned PDFs",
     type=["pdf"],
@@ -69,19 +130,45 @@ uploaded_files = st.file_uploader(
 
 if uploaded_files:
     st.divider()
+    results = []
+    renamed = []
+    dpi_steps = tuple(sorted({coarse_dpi, fine_dpi}))
+    preprocess_steps = tuple(s for s in PREPROCESS_STEPS if s in preprocess)
 
     for uploaded_file in uploaded_files:
         st.subheader(f"📄 {uploaded_file.name}")
 
         with st.spinner("Running OCR..."):
-            smo_ref, confidence = extract_smo_via_ocr_with_confidence(uploaded_file)
+            smo_ref, confidence, dpi, ocr_stats = cached_ocr(
+                uploaded_file,
+                workers=page_workers,
+                stop_confidence=stop_confidence or None,
+                dpi_steps=dpi_steps,
+                refine_below=refine_below,
+                backend=ocr_backend,
+                preprocess=preprocess_steps
+            )
+        # Timings are from the original OCR run, also when served from the cache
+        per_page = ocr_stats["seconds"] / ocr_stats["pages"] if ocr_stats["pages"] else 0.0
+
+        results.append({
+            "File": uploaded_file.name,
+            "SMO Reference": smo_ref or "",
+            "Confidence (%)": confidence,
+            "DPI": dpi,
+            "Pages OCR'd": ocr_stats["pages"],
+            "OCR time (s)": round(ocr_stats["seconds"], 2),
+            "Time per page (s)": round(per_page, 2),
+            "Preprocessing": "+".join(preprocess_steps) or "none",
+        })
 
         if smo_ref:
             st.success(f"✅ Found: **{smo_ref}**")
-            st.write(f"📊 OCR Confidence: **{confidence}%**")
+            st.write(f"📊 OCR Confidence: **{confidence}%** at **{dpi} DPI**")
+            st.caption(f"⏱️ {ocr_stats['pages']} pages OCR'd in {ocr_stats['seconds']:.2f}s ({per_page:.2f}s per page)")
 
-            uploaded_file.seek(0)
-            pdf_bytes = uploaded_file.read()
+            pdf_bytes = uploaded_file.getvalue()
+            renamed.append((f"{smo_ref}.pdf", pdf_bytes))
 
             st.download_button(
                 label=f"⬇️ Download {smo_ref}.pdf",
@@ -98,3 +185,15 @@ if uploaded_files:
             )
 
         st.divider()
+
+    st.subheader("📋 Results")
+    st.dataframe(results)
+
+    if renamed:
+        st.download_button(
+            label=f"📦 Download all {len(renamed)} renamed PDFs (ZIP)",
+            data=build_renamed_zip(renamed),
+            file_name="renamed_smo_pdfs.zip",
+            mime="application/zip",
+            key="download_all_zip"
+        )
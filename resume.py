@@ -1,12 +1,17 @@
 import streamlit as st
 import pdfplumber
 import openai
-from io import BytesIO
-from docx import Document
+
+from llm_cache import ResponseCache
+from resume_doc import parse_resume, render_docx
 
 # ---------------- CONFIG ----------------
 openai.api_key = st.secrets["OPENAI_API_KEY"]
 
+MODEL = "gpt-4.1-mini"
+SYSTEM_MESSAGE = "You are an expert ATS resume reviewer."
+TEMPERATURE = 0.3
+
 # ---------------- HELPERS ----------------
 def extract_pdf_text(file):
     text = ""
@@ -16,7 +21,15 @@ def extract_pdf_text(file):
     return text
 
 
-def optimize_resume(resume_text, jd_text):
+@st.cache_resource
+def get_llm_cache():
+    return ResponseCache()
+
+
+def optimize_resume(resume_text, jd_text, force=False):
+    """
+    Returns (optimized resume, served from cache).
+    """
     prompt = f"""
 I am providing two artifacts:
 
@@ -31,27 +44,29 @@ Rewrite the resume to be ATS-optimized, entry-level friendly,
 STAR-method compliant, truthful, and 1-page.
 """
 
-    response = openai.ChatCompletion.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": "You are an expert ATS resume reviewer."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.3
+    def create():
+        response = openai.ChatCompletion.create(
+            model=MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_MESSAGE},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=TEMPERATURE
+        )
+        return response.choices[0].message.content
+
+    return get_llm_cache().get_or_create(
+        create,
+        force=force,
+        model=MODEL,
+        system=SYSTEM_MESSAGE,
+        temperature=TEMPERATURE,
+        prompt=prompt,
     )
 
-    return response.choices[0].message.content
-
 
 def create_docx(text):
-    doc = Document()
-    for line in text.split("\n"):
-        doc.add_paragraph(line)
-
-    buffer = BytesIO()
-    doc.save(buffer)
-    buffer.seek(0)
-    return buffer
+    return render_docx(parse_resume(text))
 
 
 # ---------------- UI ----------------
@@ -62,6 +77,10 @@ st.caption("Upload your CV, paste a Job Description, get an ATS-ready resume")
 
 cv_file = st.file_uploader("Upload your CV (PDF)", type=["pdf"])
 jd_text = st.text_area("Job Description")
+force_regenerate = st.checkbox(
+    "Force regenerate",
+    help="Ignore the cached answer for this CV and job description and call the API again"
+)
 
 if st.button("Optimize Resume"):
     if not cv_file or not jd_text:
@@ -71,9 +90,11 @@ if st.button("Optimize Resume"):
             resume_text = extract_pdf_text(cv_file)
 
         with st.spinner("Optimizing with AI..."):
-            optimized_resume = optimize_resume(resume_text, jd_text)
+            optimized_resume, cached = optimize_resume(resume_text, jd_text, force_regenerate)
 
-        st.success("Resume optimized!")
+        st.success("Resume optimized!" + (" (from cache)" if cached else ""))
+        hits, misses, entries, size = get_llm_cache().stats()
+        st.caption(f"Response cache: {hits} hits / {misses} misses, {entries} entries ({size / 1024:.0f} KB)")
 
         st.subheader("Preview")
         st.text_area(
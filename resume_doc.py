@@ -0,0 +1,272 @@
+"""
+Parse-once document model for the optimized resume text returned by the LLM,
+rendered to PDF (builder.py), DOCX (resume.py, builder.py) and the Markdown
+preview. Must not import streamlit.
+"""
+import functools
+import hashlib
+import io
+import os
+import re
+import tempfile
+from collections import namedtuple
+from pathlib import Path
+
+from docx import Document
+from fontTools import subset as font_subset
+from fontTools.ttLib import TTFont
+from fpdf import FPDF
+
+# kind: title, heading, subheading, bullet, paragraph, blank or rule
+Block = namedtuple("Block", ["kind", "text"])
+
+# The section headers SYSTEM_PROMPT asks for, which come back without "##"
+SECTION_HEADERS = {"summary", "impact snapshot", "experience", "education", "skills"}
+
+# Typographic characters ATS parsers trip over, mapped in one pass
+CLEAN_TABLE = str.maketrans({
+    "\u2014": "-",      # em dash
+    "\u2013": "-",      # en dash
+    "\u2212": "-",      # minus sign
+    "\u201c": '"',      # smart quotes
+    "\u201d": '"',
+    "\u2018": "'",
+    "\u2019": "'",
+    "\u2026": "...",    # ellipsis
+    "\u00a0": " ",      # non-breaking space
+    "\u200b": None,     # zero-width space
+    "\ufeff": None,     # byte order mark
+})
+
+BOLD = re.compile(r"\*\*(.*?)\*\*")
+PREFIXES = (
+    ("### ", "subheading"),
+    ("## ", "heading"),
+    ("# ", "title"),
+    ("* ", "bullet"),
+    ("- ", "bullet"),
+    ("\u2022 ", "bullet"),
+)
+
+# Unicode TrueType fonts tried in order; RESUME_FONT / RESUME_FONT_BOLD override
+FONT_CANDIDATES = [
+    ("/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+    ("/usr/share/fonts/dejavu/DejaVuSans.ttf", "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf"),
+    ("/Library/Fonts/Arial Unicode.ttf", "/Library/Fonts/Arial Unicode.ttf"),
+    ("C:/Windows/Fonts/arial.ttf", "C:/Windows/Fonts/arialbd.ttf"),
+]
+
+# The fonts are cut down once to what resumes use (Latin, punctuation,
+# currency, arrows, bullets), so each PDF loads a small font instead of the
+# whole of DejaVu. Documents with other characters use the full font.
+RESUME_UNICODES = "0020-007E,00A0-024F,2000-206F,20A0-20CF,2100-214F,2190-21FF,2200-22FF,25A0-25FF"
+FONT_CACHE_DIR = Path("runtime") / "fonts"
+
+# (font size, line height, space before, space after) per block kind in the PDF
+PDF_STYLES = {
+    "title": (16, 8, 0, 2),
+    "heading": (12, 6, 2, 1),
+    "subheading": (10, 5, 0, 1),
+    "bullet": (9, 5, 0, 0),
+    "paragraph": (10, 5, 0, 0),
+}
+
+
+# ---------------- PARSING ----------------
+@functools.lru_cache(maxsize=256)
+def parse_resume(text):
+    """
+    Split LLM output into a tuple of Blocks, once per distinct text.
+    """
+    blocks = []
+    for line in text.translate(CLEAN_TABLE).split("\n"):
+        line = line.strip()
+        if not line:
+            blocks.append(Block("blank", ""))
+            continue
+        if line == "---":
+            blocks.append(Block("rule", ""))
+            continue
+
+        kind = "paragraph"
+        for prefix, prefix_kind in PREFIXES:
+            if line.startswith(prefix):
+                kind, line = prefix_kind, line[len(prefix):].strip()
+                break
+
+        line = BOLD.sub(r"\1", line)
+        if kind == "paragraph" and line.rstrip(":").lower() in SECTION_HEADERS:
+            kind = "heading"
+        if line:
+            blocks.append(Block(kind, line))
+    return tuple(blocks)
+
+
+def to_markdown(blocks):
+    """
+    Markdown preview of the document, as the renderers will lay it out.
+    """
+    prefixes = {"title": "# ", "heading": "## ", "subheading": "### ", "bullet": "* "}
+    lines = []
+    for block in blocks:
+        if block.kind == "rule":
+            # Blank lines around it, or Markdown reads the line above as a heading
+            lines.append("\n---\n")
+        elif block.kind == "paragraph":
+            # Two trailing spaces keep consecutive paragraph lines on separate lines
+            lines.append(block.text + "  ")
+        else:
+            lines.append(prefixes.get(block.kind, "") + block.text)
+    return "\n".join(lines)
+
+
+# ---------------- PDF ----------------
+@functools.lru_cache(maxsize=None)
+def find_unicode_font():
+    """
+    (regular, bold) TrueType paths, or None to fall back to core fonts.
+    """
+    regular = os.environ.get("RESUME_FONT")
+    if regular and os.path.exists(regular):
+        return regular, os.environ.get("RESUME_FONT_BOLD", regular)
+    for regular, bold in FONT_CANDIDATES:
+        if os.path.exists(regular):
+            return regular, bold if os.path.exists(bold) else regular
+    return None
+
+
+def subset_font(path):
+    """
+    Path of a copy of the font at path holding only RESUME_UNICODES,
+    built on first use and kept in FONT_CACHE_DIR.
+    """
+    stat = os.stat(path)
+    key = hashlib.sha256(f"{path} {stat.st_size} {stat.st_mtime_ns} {RESUME_UNICODES}".encode()).hexdigest()
+    target = FONT_CACHE_DIR / f"{Path(path).stem}-{key[:16]}.ttf"
+    if target.exists():
+        return target
+
+    options = font_subset.Options()
+    options.layout_features = ["*"]
+    options.name_IDs = ["*"]
+    options.glyph_names = True
+    options.notdef_outline = True
+    options.drop_tables += ["FFTM"]
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(unicodes=font_subset.parse_unicodes(RESUME_UNICODES))
+    font = TTFont(path)
+    subsetter.subset(font)
+
+    # Written to a temp file and renamed, so other processes never load half a font
+    FONT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    fd, staging = tempfile.mkstemp(dir=FONT_CACHE_DIR, prefix=".staging_", suffix=".ttf")
+    with os.fdopen(fd, "wb") as f:
+        font.save(f)
+    os.replace(staging, target)
+    return target
+
+
+@functools.lru_cache(maxsize=None)
+def resume_fonts():
+    """
+    ((regular, bold) subset paths, code points both cover), or None when
+    there is no Unicode font or the subsets can't be built.
+    """
+    font = find_unicode_font()
+    if not font:
+        return None
+    try:
+        paths = tuple(str(subset_font(path)) for path in font)
+        coverage = None
+        for path in paths:
+            with TTFont(path, lazy=True) as ttf:
+                cmap = frozenset(ttf.getBestCmap())
+            coverage = cmap if coverage is None else coverage & cmap
+    except Exception:
+        return None
+    return paths, coverage
+
+
+class PDF(FPDF):
+    """Custom PDF class for resume"""
+    def header(self):
+        pass
+
+    def footer(self):
+        pass
+
+
+def render_pdf(blocks):
+    """
+    Lay out parsed blocks as an A4 PDF. Uses a Unicode TrueType font when
+    one is installed (its resume_fonts subset when that covers the text);
+    otherwise core Helvetica, which only covers Latin-1.
+    Returns the PDF bytes.
+    """
+    pdf = PDF()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.set_left_margin(15)
+    pdf.set_right_margin(15)
+
+    font = find_unicode_font()
+    if font:
+        bullet = "\u2022 "
+        subset = resume_fonts()
+        if subset and all(ord(c) in subset[1] for block in blocks for c in block.text + bullet):
+            font = subset[0]
+        pdf.add_font("ResumeSans", "", font[0])
+        pdf.add_font("ResumeSans", "B", font[1])
+        family = "ResumeSans"
+    else:
+        family, bullet = "Helvetica", "- "
+
+    current_font = None
+    for block in blocks:
+        if block.kind == "blank":
+            pdf.ln(3)
+            continue
+        if block.kind == "rule":
+            pdf.ln(2)
+            continue
+
+        size, height, before, after = PDF_STYLES[block.kind]
+        style = "B" if block.kind in ("title", "heading", "subheading") else ""
+        # Switching fonts is only done when the style actually changes
+        if current_font != (style, size):
+            pdf.set_font(family, style, size)
+            current_font = (style, size)
+
+        text = bullet + block.text if block.kind == "bullet" else block.text
+        if not font:
+            text = text.encode("latin-1", "replace").decode("latin-1")
+
+        if before:
+            pdf.ln(before)
+        pdf.multi_cell(0, height, text, new_x="LMARGIN", new_y="NEXT")
+        if after:
+            pdf.ln(after)
+
+    return bytes(pdf.output())
+
+
+# ---------------- DOCX ----------------
+def render_docx(blocks):
+    """
+    Word document with real headings and bulleted lists. Returns a BytesIO.
+    """
+    doc = Document()
+    levels = {"title": 0, "heading": 1, "subheading": 2}
+
+    for block in blocks:
+        if block.kind in levels:
+            doc.add_heading(block.text, level=levels[block.kind])
+        elif block.kind == "bullet":
+            doc.add_paragraph(block.text, style="List Bullet")
+        elif block.kind == "paragraph":
+            doc.add_paragraph(block.text)
+
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    buffer.seek(0)
+    return buffer
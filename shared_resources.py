@@ -0,0 +1,53 @@
+"""
+Helpers shared by the OCR tools (smo_ocr.py, ocr_pipeline.py) and the ZIP
+merger (zip_merge.py, zip_unlock.py): the process pool and disk usage.
+Must not import streamlit.
+
+One process pool of POOL_WORKERS processes serves every caller and every
+Streamlit session. Callers limit their own parallelism by how many jobs
+they keep in flight, so changing a worker count never touches work other
+sessions have queued. The pool is only replaced after a worker crash
+breaks it.
+"""
+import os
+import threading
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# ---------------- PROCESS POOL ----------------
+POOL_WORKERS = os.cpu_count() or 1
+
+# A job's future failed because the pool did, not because of the job
+LOST_JOB_ERRORS = (BrokenProcessPool, CancelledError)
+# submit() on a pool that broke or was shut down
+SUBMIT_ERRORS = (BrokenProcessPool, RuntimeError)
+
+_pool = {"pool": None}
+_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    The shared pool, started on first use or after a crash.
+    """
+    with _lock:
+        if _pool["pool"] is None:
+            _pool["pool"] = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+        return _pool["pool"]
+
+
+def discard_pool(pool):
+    """
+    Drop a pool that raised one of LOST_JOB_ERRORS / SUBMIT_ERRORS (a
+    worker died, e.g. out of memory); the next get_pool starts a fresh one.
+    Safe to call more than once, and never touches a pool that replaced it.
+    """
+    with _lock:
+        if _pool["pool"] is pool:
+            _pool["pool"] = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ---------------- DISK USAGE ----------------
+def dir_size(path):
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
@@ -0,0 +1,361 @@
+"""
+OCR-based SMO reference extraction used by the Streamlit renamer (rename.py).
+Kept free of streamlit so it can be benchmarked and reused headless.
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, wait
+
+import pandas as pd
+import pdfplumber
+import pytesseract
+
+from image_preprocess import preprocess_image
+from shared_resources import LOST_JOB_ERRORS, SUBMIT_ERRORS, discard_pool, get_pool
+
+# Optional in-process engine: pip install tesserocr
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+SMO_PATTERN = r"(SMO[A-Z0-9]+)"
+# A word that is only the start of a reference, continued in the next word;
+# the rebuilt reference must hold a digit so "ITEMS MONDAY" isn't read as one
+SMO_SPLIT_PREFIX = r"S|SM|SMO"
+SMO_SPLIT_DIGIT = r"\d"
+LINE_KEYS = ["page_num", "block_num", "par_num", "line_num"]
+
+# Coarse-to-fine rendering: pages are OCR'd at the first DPI and only
+# re-rendered at the next one when there is no match or its confidence
+# is below REFINE_BELOW
+DPI_STEPS = (150, 300)
+REFINE_BELOW = 85
+
+DEFAULT_BACKEND = "pytesseract"
+
+
+def clean_ocr_words(ocr_data):
+    """
+    Drop empty rows and add the upper-cased, space-free clean_text column.
+    """
+    ocr_data = ocr_data.dropna(subset=["text", "conf"]).copy()
+    ocr_data["clean_text"] = (
+        ocr_data["text"].astype(str).str.upper().str.replace(" ", "")
+    )
+    return ocr_data
+
+
+def best_smo_match(ocr_data, rebuild_split=True):
+    """
+    Vectorized match-and-confidence pass over one page of
+    pytesseract.image_to_data output.
+    With rebuild_split, references tesseract broke across two adjacent
+    words of the same line ("SMO 123456") are joined back together and
+    scored with the lower of the two word confidences.
+    Returns (SMO_REFERENCE, confidence) or (None, 0).
+    """
+    words = clean_ocr_words(ocr_data)
+    if words.empty:
+        return None, 0
+
+    text = words["clean_text"]
+    conf = words["conf"].astype(float)
+    matches = text.str.extract(SMO_PATTERN, expand=False)
+
+    # Words that are just the start of a reference may continue in the next word
+    tail = matches.isna() & text.str.fullmatch(SMO_SPLIT_PREFIX)
+    if rebuild_split and tail.any() and all(k in words.columns for k in LINE_KEYS):
+        line_keys = [words[k] for k in LINE_KEYS]
+        next_text = text.groupby(line_keys, sort=False).shift(-1)
+        next_conf = conf.groupby(line_keys, sort=False).shift(-1)
+        next_match = matches.groupby(line_keys, sort=False).shift(-1)
+
+        joined = (text + next_text.fillna("")).str.extract(SMO_PATTERN, expand=False)
+        split = (
+            tail & next_text.notna() & joined.notna() & (joined != next_match)
+            & joined.str.contains(SMO_SPLIT_DIGIT, na=False)
+        )
+        matches = matches.where(~split, joined)
+        conf = conf.where(~split, conf.clip(upper=next_conf))
+
+    # Only positive confidences count; idxmax keeps the first of equal maxima
+    candidates = conf[matches.notna() & (conf > 0)]
+    if candidates.empty:
+        return None, 0
+
+    best = candidates.idxmax()
+    return matches[best], float(conf[best])
+
+
+# ---------------- OCR BACKENDS ----------------
+class PytesseractBackend:
+    """
+    Default backend: one tesseract process per page via pytesseract.
+    """
+    name = "pytesseract"
+
+    def image_to_data(self, image):
+        # OCR with confidence data
+        return pytesseract.image_to_data(
+            image, output_type=pytesseract.Output.DATAFRAME
+        )
+
+
+class TesserocrBackend:
+    """
+    In-process backend: keeps a warm tesseract API handle per thread and
+    hands it the image buffer directly, with no temp files or process
+    start-up per page. Returns the same columns as pytesseract.
+    """
+    name = "tesserocr"
+
+    def __init__(self, lang="eng"):
+        self.lang = lang
+        self.local = threading.local()
+
+    def api(self):
+        if not hasattr(self.local, "api"):
+            self.local.api = tesserocr.PyTessBaseAPI(lang=self.lang)
+        return self.local.api
+
+    def image_to_data(self, image):
+        api = self.api()
+        api.SetImage(image)
+        api.Recognize()
+        tsv = api.GetTSVText(0)
+        # GetTSVText has no header row and numbers pages from 1
+        return pd.read_csv(
+            io.StringIO(tsv),
+            sep="\t",
+            names=["level", "page_num", "block_num", "par_num", "line_num", "word_num",
+                   "left", "top", "width", "height", "conf", "text"],
+            quoting=3,
+            keep_default_na=False,
+            na_values=[""],
+        )
+
+
+BACKENDS = {
+    PytesseractBackend.name: PytesseractBackend,
+    TesserocrBackend.name: TesserocrBackend,
+}
+
+# One instance per backend and process, so handles stay warm between pages
+_backend_instances = {}
+
+
+def available_backends():
+    return [name for name in BACKENDS if name != TesserocrBackend.name or tesserocr is not None]
+
+
+def get_backend(name=DEFAULT_BACKEND):
+    if name not in available_backends():
+        raise ValueError(f"OCR backend '{name}' is not available")
+    if name not in _backend_instances:
+        _backend_instances[name] = BACKENDS[name]()
+    return _backend_instances[name]
+
+
+def ocr_page(page, resolution=300, backend=DEFAULT_BACKEND, preprocess=()):
+    """
+    Render one pdfplumber page, optionally clean it up (see
+    image_preprocess.PREPROCESS_STEPS) and OCR it.
+    Returns best_smo_match's (SMO_REFERENCE, confidence).
+    """
+    image = page.to_image(resolution=resolution).original
+    if preprocess:
+        image = preprocess_image(image, preprocess)
+    return best_smo_match(get_backend(backend).image_to_data(image))
+
+
+def ocr_page_adaptive(page, dpi_steps=DPI_STEPS, refine_below=REFINE_BELOW, backend=DEFAULT_BACKEND,
+                      preprocess=()):
+    """
+    OCR a page at each DPI in dpi_steps until a match reaches refine_below.
+    Returns (SMO_REFERENCE, confidence, dpi) for the best attempt;
+    dpi is the resolution that produced the match.
+    """
+    best = (None, 0, None)
+    for dpi in dpi_steps:
+        match, conf = ocr_page(page, dpi, backend, preprocess)
+        if match and conf > best[1]:
+            best = (match, conf, dpi)
+        if best[0] and best[1] >= refine_below:
+            break
+    return best
+
+
+# ---------------- PAGE-PARALLEL OCR ----------------
+# Each worker process keeps the PDF it is working on open between pages
+_worker_pdf = {"path": None, "pdf": None}
+# Times a page taken down by a broken pool is retried on its own
+LOST_PAGE_TRIES = 2
+
+
+def _ocr_page_in_worker(pdf_path, page_index, dpi_steps=DPI_STEPS, refine_below=REFINE_BELOW,
+                        backend=DEFAULT_BACKEND, preprocess=()):
+    # Temp file names can be reused, so the modification time is part of the key
+    key = (pdf_path, os.stat(pdf_path).st_mtime_ns)
+    if _worker_pdf["path"] != key:
+        if _worker_pdf["pdf"] is not None:
+            _worker_pdf["pdf"].close()
+        _worker_pdf["pdf"] = pdfplumber.open(pdf_path)
+        _worker_pdf["path"] = key
+    return ocr_page_adaptive(_worker_pdf["pdf"].pages[page_index], dpi_steps, refine_below, backend, preprocess)
+
+
+def ocr_pages_parallel(pdf_path, n_pages, workers, stop_confidence=None, max_in_flight=None,
+                       dpi_steps=DPI_STEPS, refine_below=REFINE_BELOW, backend=DEFAULT_BACKEND,
+                       preprocess=()):
+    """
+    OCR pages on the shared process pool with at most max_in_flight
+    (default workers) pages rendered or queued at once, so memory stays
+    bounded and other sessions keep their share of the pool.
+    Stops submitting pages once a match reaches stop_confidence.
+    If a worker dies and breaks the pool, the pages it took down are
+    retried one at a time on a fresh pool; a page lost LOST_PAGE_TRIES
+    times there is skipped.
+    Returns {page_index: (SMO_REFERENCE, confidence, dpi)} for the pages OCR'd.
+    """
+    args = (dpi_steps, refine_below, backend, preprocess)
+    pool = get_pool()
+    max_in_flight = max_in_flight or workers
+    results = {}
+    pending = {}
+    lost = []
+    next_page = 0
+    stop = False
+
+    while not lost and (pending or (next_page < n_pages and not stop)):
+        while not stop and next_page < n_pages and len(pending) < max_in_flight:
+            try:
+                future = pool.submit(_ocr_page_in_worker, str(pdf_path), next_page, *args)
+            except SUBMIT_ERRORS:
+                lost.append(next_page)
+                next_page += 1
+                break
+            pending[future] = next_page
+            next_page += 1
+
+        # Once the pool is gone, collect whatever it still finishes
+        done = ()
+        if pending:
+            done, _ = wait(pending, return_when=ALL_COMPLETED if lost else FIRST_COMPLETED)
+        for future in done:
+            page = pending.pop(future)
+            try:
+                results[page] = future.result()
+            except LOST_JOB_ERRORS:
+                lost.append(page)
+                continue
+            match, conf, _ = results[page]
+            if match and stop_confidence and conf >= stop_confidence:
+                stop = True
+
+        if lost:
+            discard_pool(pool)
+            lost += pending.values()
+            pending = {}
+        elif stop:
+            for future in pending:
+                future.cancel()
+            # Pages already rendering still finish; their results may be better
+            for future in [f for f in pending if not f.cancelled()]:
+                try:
+                    results[pending[future]] = future.result()
+                except LOST_JOB_ERRORS:
+                    discard_pool(pool)
+            pending = {}
+
+    if lost and not stop:
+        queue = sorted(lost) + list(range(next_page, n_pages))
+        crashes = {}
+        while queue:
+            page = queue.pop(0)
+            pool = get_pool()
+            try:
+                future = pool.submit(_ocr_page_in_worker, str(pdf_path), page, *args)
+            except SUBMIT_ERRORS:
+                discard_pool(pool)
+                pool = get_pool()
+                future = pool.submit(_ocr_page_in_worker, str(pdf_path), page, *args)
+            try:
+                results[page] = future.result()
+            except LOST_JOB_ERRORS:
+                discard_pool(pool)
+                # The crash may have come from another caller's job on the shared pool
+                crashes[page] = crashes.get(page, 0) + 1
+                if crashes[page] < LOST_PAGE_TRIES:
+                    queue.append(page)
+                continue
+            match, conf, _ = results[page]
+            if match and stop_confidence and conf >= stop_confidence:
+                break
+
+    return results
+
+
+def extract_smo_via_ocr_with_confidence(pdf_file, workers=1, stop_confidence=None, max_in_flight=None,
+                                        dpi_steps=DPI_STEPS, refine_below=REFINE_BELOW,
+                                        backend=DEFAULT_BACKEND, preprocess=(), stats=None):
+    """
+    OCR-only extraction for scanned PDFs.
+    With workers > 1 pages are rendered and OCR'd on a process pool.
+    With stop_confidence, remaining pages are skipped once a match
+    reaches that confidence. Pages are OCR'd coarse-to-fine over dpi_steps
+    with the named OCR backend (see BACKENDS), after the given
+    image_preprocess steps.
+    A stats dict, when given, receives the pages OCR'd and the seconds taken.
+    Returns (SMO_REFERENCE, confidence%, dpi)
+    """
+
+    start = time.perf_counter()
+    results = {}
+
+    if workers > 1:
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+            if hasattr(pdf_file, "getbuffer"):
+                tmp.write(pdf_file.getbuffer())
+            else:
+                with open(pdf_file, "rb") as f:
+                    shutil.copyfileobj(f, tmp)
+            tmp.flush()
+
+            with pdfplumber.open(tmp.name) as pdf:
+                n_pages = len(pdf.pages)
+            results = ocr_pages_parallel(
+                tmp.name, n_pages, workers, stop_confidence, max_in_flight,
+                dpi_steps, refine_below, backend, preprocess
+            )
+    else:
+        with pdfplumber.open(pdf_file) as pdf:
+            for index, page in enumerate(pdf.pages):
+                results[index] = ocr_page_adaptive(page, dpi_steps, refine_below, backend, preprocess)
+                match, conf, _ = results[index]
+                if match and stop_confidence and conf >= stop_confidence:
+                    break
+
+    if stats is not None:
+        stats.update(pages=len(results), seconds=time.perf_counter() - start)
+
+    best_match = None
+    best_confidence = 0
+    best_dpi = None
+
+    # Same pick as a sequential scan: highest confidence, earliest page on ties
+    for index in sorted(results):
+        match, conf, dpi = results[index]
+        if match and conf > best_confidence:
+            best_match = match
+            best_confidence = conf
+            best_dpi = dpi
+
+    if best_match:
+        return best_match, round(best_confidence, 2), best_dpi
+
+    return None, None, None
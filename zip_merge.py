@@ -0,0 +1,295 @@
+"""
+ZIP -> merged PDF logic used by the Streamlit merger (zip_unlock.py).
+Kept free of streamlit so merges can run on a process pool.
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+
+from pypdf import PdfReader, PdfWriter
+
+from shared_resources import dir_size
+
+# Guards against huge or malicious archives (zip bombs, millions of entries)
+MAX_ZIP_MEMBERS = 10000
+MAX_UNCOMPRESSED_BYTES = 2 * 1024 ** 3
+
+# Merge outputs live in WORKSPACE_ROOT/<server pid>/<session>/<workspace>
+WORKSPACE_ROOT = Path(tempfile.gettempdir()) / "zip_unlock"
+WORKSPACE_QUOTA_MB = 4096
+WORKSPACE_TTL_S = 15 * 60
+DOWNLOADED_MARKER = ".downloaded"
+
+# -----------------------------
+# Merging
+# -----------------------------
+
+def pdf_members(zip_ref):
+    """
+    PDF entries of an open ZipFile in deterministic (path) order.
+    Directories and macOS resource forks (__MACOSX/) are skipped.
+    Raises ValueError when the archive breaks the size or count limits.
+    """
+    infos = zip_ref.infolist()
+    if len(infos) > MAX_ZIP_MEMBERS:
+        raise ValueError(f"ZIP has {len(infos)} entries (limit {MAX_ZIP_MEMBERS})")
+
+    pdfs = sorted(
+        (info for info in infos
+         if not info.is_dir()
+         and info.filename.lower().endswith(".pdf")
+         and not info.filename.startswith("__MACOSX/")),
+        key=lambda info: info.filename
+    )
+
+    # Declared sizes are enforced by zipfile while decompressing, so this bounds memory
+    total = sum(info.file_size for info in pdfs)
+    if total > MAX_UNCOMPRESSED_BYTES:
+        raise ValueError(
+            f"PDFs in ZIP uncompress to {total / 1024 ** 2:.0f} MB "
+            f"(limit {MAX_UNCOMPRESSED_BYTES / 1024 ** 2:.0f} MB)"
+        )
+    return pdfs
+
+
+def uncompressed_pdf_bytes(zip_file):
+    """
+    Total uncompressed size of the PDFs in a ZIP, read from its directory
+    without extracting anything. A merged PDF is about this size, so it is
+    what a workspace has to make room for. Raises ValueError like pdf_members.
+    """
+    with zipfile.ZipFile(zip_file) as zip_ref:
+        return sum(info.file_size for info in pdf_members(zip_ref))
+
+
+def image_reference(page, key):
+    """
+    idnum of the XObject behind a page.images key ("/Im0", or a path
+    through form XObjects), found without decoding the image.
+    None for inline images, which can't be replaced anyway.
+    """
+    path = [key] if isinstance(key, str) else list(key)
+    if path[-1].startswith("~"):
+        return None
+    obj = page
+    for name in path[:-1]:
+        obj = obj["/Resources"]["/XObject"][name].get_object()
+    ref = obj["/Resources"]["/XObject"].raw_get(path[-1])
+    return getattr(ref, "idnum", None)
+
+
+def optimize_merged(writer, image_quality=None):
+    """
+    Shrink a merged PdfWriter in place: recompress page content streams,
+    optionally re-encode images as JPEG at image_quality, then keep one
+    copy of objects and streams that are identical across the source PDFs
+    (shared logos, fonts) and drop the unreferenced leftovers.
+    An image used on several pages is re-encoded once.
+    """
+    if image_quality:
+        # Collapse identical images across the source PDFs first, so a logo
+        # shared by every PDF is re-encoded once rather than once per PDF
+        writer.compress_identical_objects(remove_identicals=True, remove_orphans=False)
+
+    replaced = set()
+    for page in writer.pages:
+        if image_quality:
+            for key in page.images.keys():
+                try:
+                    ref = image_reference(page, key)
+                    if ref is None or ref in replaced:
+                        continue
+                    replaced.add(ref)
+                    image = page.images[key]
+                    image.replace(image.image, quality=image_quality)
+                except Exception:
+                    # Masks, CMYK and other exotic images stay as they are
+                    continue
+        page.compress_content_streams()
+
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+
+
+def merge_pdfs_from_zip(zip_file, out_dir=None, optimize=False, image_quality=None):
+    """
+    Merge the PDFs inside an uploaded ZIP, read straight from the
+    in-memory upload; nothing but the merged PDF is written to disk,
+    into out_dir (a new temp directory by default).
+    With optimize, the output goes through optimize_merged.
+    Returns (output_path, out_dir, stats) where stats holds the PDF and
+    page counts and the input / output sizes in bytes.
+    """
+    writer = PdfWriter()
+    stats = {"pdfs": 0, "pages": 0, "input_bytes": 0, "output_bytes": 0}
+
+    with zipfile.ZipFile(zip_file) as zip_ref:
+        members = pdf_members(zip_ref)
+        if not members:
+            raise ValueError(f"No PDFs found in {zip_file.name}")
+
+        for info in members:
+            # PdfReader seeks backwards, which is slow on compressed entries,
+            # so each PDF is read into memory once
+            reader = PdfReader(io.BytesIO(zip_ref.read(info)))
+            for page in reader.pages:
+                writer.add_page(page)
+            stats["pdfs"] += 1
+            stats["pages"] += len(reader.pages)
+            stats["input_bytes"] += info.file_size
+
+    if optimize:
+        optimize_merged(writer, image_quality)
+
+    # Create unique temp directory for each ZIP
+    out_dir = out_dir or tempfile.mkdtemp()
+    output_path = os.path.join(out_dir, f"{zip_file.name.replace('.zip','')}_merged.pdf")
+
+    # Written under a dot name and renamed, so a visible file is always complete
+    partial_path = os.path.join(out_dir, ".merging.pdf")
+    with open(partial_path, "wb") as f:
+        writer.write(f)
+    os.replace(partial_path, output_path)
+    stats["output_bytes"] = os.path.getsize(output_path)
+
+    return output_path, out_dir, stats
+
+
+# -----------------------------
+# Parallel merging
+# -----------------------------
+def merge_zip_bytes(name, data, out_dir=None, optimize=False, image_quality=None):
+    """
+    Process-pool entry point: merge a ZIP given as bytes.
+    """
+    buffer = io.BytesIO(data)
+    buffer.name = name
+    return merge_pdfs_from_zip(buffer, out_dir, optimize, image_quality)
+
+
+# -----------------------------
+# Workspaces
+# -----------------------------
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WorkspaceManager:
+    """
+    Per-session output directories under one root with a total disk quota.
+    Workspaces are evicted once their output has been downloaded or after
+    ttl_s; when a new one would not fit, the oldest are evicted first.
+    Directories left behind by dead server processes are swept on start-up.
+    """
+
+    def __init__(self, root=WORKSPACE_ROOT, quota_mb=WORKSPACE_QUOTA_MB, ttl_s=WORKSPACE_TTL_S):
+        self.root = Path(root)
+        self.home = self.root / str(os.getpid())
+        self.quota_bytes = quota_mb * 1024 * 1024
+        self.ttl_s = ttl_s
+        self.lock = threading.Lock()
+        self.home.mkdir(parents=True, exist_ok=True)
+        self.sweep_orphans()
+
+    def sweep_orphans(self):
+        """
+        Remove everything under root not owned by a running server process.
+        """
+        for entry in self.root.iterdir():
+            if entry.name.isdigit() and pid_alive(int(entry.name)):
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+
+    def workspaces(self):
+        return [w for session in self.home.iterdir() if session.is_dir()
+                for w in session.iterdir() if w.is_dir()]
+
+    def finished(self, workspace):
+        """
+        True once the merged output is in place; until then a merge
+        (possibly another session's) is still writing to it.
+        """
+        return any(not p.name.startswith(".") for p in workspace.iterdir())
+
+    def downloaded(self, workspace):
+        return (Path(workspace) / DOWNLOADED_MARKER).exists()
+
+    def remove(self, workspace):
+        workspace = Path(workspace)
+        shutil.rmtree(workspace, ignore_errors=True)
+        session = workspace.parent
+        if session != self.home and session.is_dir() and not any(session.iterdir()):
+            session.rmdir()
+
+    def evict_expired(self, keep=()):
+        """
+        Drop downloaded workspaces and those older than the TTL.
+        """
+        now = time.time()
+        for workspace in self.workspaces():
+            if workspace in keep:
+                continue
+            if self.downloaded(workspace) or now - workspace.stat().st_mtime > self.ttl_s:
+                self.remove(workspace)
+
+    def create(self, session_id, expected_bytes=0, keep=()):
+        """
+        New workspace directory for session_id. Evicts expired workspaces,
+        then the oldest finished ones (except those in keep) until expected_bytes
+        more would fit in the quota. Raises ValueError if it still won't.
+        """
+        keep = {Path(k) for k in keep}
+        with self.lock:
+            self.evict_expired(keep)
+            entries = sorted(self.workspaces(), key=lambda w: w.stat().st_mtime)
+            sizes = {w: dir_size(w) for w in entries}
+            total = sum(sizes.values())
+            pinned = sum(sizes[w] for w in entries if w in keep)
+
+            # Evicting can't help if the kept workspaces alone leave no room
+            if pinned + expected_bytes <= self.quota_bytes:
+                for workspace in entries:
+                    if total + expected_bytes <= self.quota_bytes:
+                        break
+                    if workspace not in keep and self.finished(workspace):
+                        self.remove(workspace)
+                        total -= sizes[workspace]
+
+            if total + expected_bytes > self.quota_bytes:
+                raise ValueError(
+                    f"Workspace quota of {self.quota_bytes / 1024 ** 2:.0f} MB is full, "
+                    f"try again once current downloads finish"
+                )
+
+            session = self.home / session_id
+            session.mkdir(parents=True, exist_ok=True)
+            return Path(tempfile.mkdtemp(dir=session))
+
+    def mark_downloaded(self, workspace):
+        """
+        Flag a workspace's output as delivered; it goes on the next eviction.
+        """
+        workspace = Path(workspace)
+        if workspace.is_dir():
+            (workspace / DOWNLOADED_MARKER).touch()
+
+    def usage(self):
+        """
+        (bytes used, number of workspaces) across all sessions.
+        """
+        with self.lock:
+            workspaces = self.workspaces()
+            return sum(dir_size(w) for w in workspaces), len(workspaces)
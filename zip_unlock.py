@@ -1,51 +1,58 @@
 import streamlit as st
-import zipfile
 import os
-import shutil
-from pypdf import PdfReader, PdfWriter
-import tempfile
+import uuid
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from shared_resources import LOST_JOB_ERRORS, SUBMIT_ERRORS, discard_pool, get_pool
+from zip_merge import (
+    WORKSPACE_QUOTA_MB,
+    WORKSPACE_TTL_S,
+    WorkspaceManager,
+    merge_pdfs_from_zip,
+    merge_zip_bytes,
+    uncompressed_pdf_bytes,
+)
+
 
 # -----------------------------
 # Utility Function
 # -----------------------------
 
-def merge_pdfs_from_zip(zip_file):
-    # Create unique temp directory for each ZIP
-    temp_dir = tempfile.mkdtemp()
-
-    zip_path = os.path.join(temp_dir, zip_file.name)
-
-    # Save uploaded ZIP
-    with open(zip_path, "wb") as f:
-        f.write(zip_file.getbuffer())
-
-    # Extract ZIP
-    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
+@st.cache_resource
+def get_workspaces():
+    # Created once per server process, which also sweeps orphaned workspaces
+    return WorkspaceManager(quota_mb=WORKSPACE_QUOTA_MB, ttl_s=WORKSPACE_TTL_S)
 
-    writer = PdfWriter()
-    pdf_found = False
 
-    # Walk through extracted folder
-    for root, _, files_list in os.walk(temp_dir):
-        for file in sorted(files_list):
-            if file.lower().endswith(".pdf"):
-                pdf_path = os.path.join(root, file)
-                reader = PdfReader(pdf_path)
-                for page in reader.pages:
-                    writer.add_page(page)
-                pdf_found = True
+def show_result(uploaded_file, merged_path=None, error=None, workspace=None, stats=None):
+    if error is not None:
+        # Some errors (e.g. a cancelled merge) carry no message
+        st.error(f"❌ {str(error) or type(error).__name__}")
+        return
 
-    if not pdf_found:
-        shutil.rmtree(temp_dir)
-        raise ValueError(f"No PDFs found in {zip_file.name}")
+    st.success("✅ Merge completed!")
+    if stats:
+        st.caption(
+            f"{stats['pdfs']} PDFs, {stats['pages']} pages: "
+            f"{stats['input_bytes'] / 1024 ** 2:.2f} MB in → {stats['output_bytes'] / 1024 ** 2:.2f} MB out"
+        )
 
-    output_path = os.path.join(temp_dir, f"{zip_file.name.replace('.zip','')}_merged.pdf")
+    with open(merged_path, "rb") as f:
+        st.download_button(
+            label=f"⬇ Download {uploaded_file.name.replace('.zip','')}_merged.pdf",
+            data=f,
+            file_name=f"{uploaded_file.name.replace('.zip','')}_merged.pdf",
+            mime="application/pdf",
+            key=f"download_{uploaded_file.file_id}",
+            on_click=mark_downloaded,
+            args=(uploaded_file.file_id, workspace)
+        )
 
-    with open(output_path, "wb") as f:
-        writer.write(f)
 
-    return output_path, temp_dir
+def mark_downloaded(file_id, workspace):
+    # Its workspace may now be evicted; later reruns say so instead of merging again
+    workspaces.mark_downloaded(workspace)
+    st.session_state["downloaded"].add(file_id)
 
 
 # -----------------------------
@@ -54,33 +61,208 @@ def merge_pdfs_from_zip(zip_file):
 
 st.set_page_config(page_title="Batch ZIP PDF Merger", page_icon="📂")
 
+workspaces = get_workspaces()
+session_id = st.session_state.setdefault("workspace_session", uuid.uuid4().hex)
+
 st.title("📂 Batch ZIP → PDF Merger")
 st.write("Upload multiple ZIP files. Each ZIP will generate its own merged PDF.")
 
+with st.sidebar:
+    st.header("⚙️ Settings")
+    workers = st.number_input(
+        "ZIPs merged in parallel",
+        min_value=1,
+        max_value=os.cpu_count() or 1,
+        value=min(4, os.cpu_count() or 1),
+        help="ZIPs are merged on a process pool; 1 merges them one at a time"
+    )
+    optimize = st.checkbox(
+        "Optimise output size",
+        value=True,
+        help="Store logos, fonts and other objects shared between the PDFs once and recompress page streams"
+    )
+    image_quality = st.slider(
+        "Recompress images (JPEG quality)",
+        min_value=0,
+        max_value=95,
+        value=0,
+        step=5,
+        disabled=not optimize,
+        help="Re-encode embedded images as JPEG at this quality; 0 keeps images untouched"
+    )
+    disk_status = st.empty()
+
 uploaded_files = st.file_uploader(
     "Upload one or more ZIP files",
     type=["zip"],
     accept_multiple_files=True
 )
 
+# Merged outputs of this session by upload, so reruns (e.g. the one a
+# download click triggers) reuse them instead of merging again:
+# file_id -> (merged path, workspace, stats, settings)
+merged = st.session_state.setdefault("merged", {})
+# Uploads whose merged PDF was downloaded, by file_id
+downloaded = st.session_state.setdefault("downloaded", set())
+settings = (optimize, image_quality)
+
+# Workspaces of ZIPs no longer uploaded can go right away
+uploaded_ids = {uploaded_file.file_id for uploaded_file in uploaded_files or []}
+for file_id in [f for f in merged if f not in uploaded_ids]:
+    workspaces.remove(merged.pop(file_id)[1])
+downloaded &= uploaded_ids
+
+
+def merged_result(uploaded_file):
+    entry = merged.get(uploaded_file.file_id)
+    if entry and entry[3] == settings and os.path.exists(entry[0]):
+        return entry
+    return None
+
+
+def already_downloaded(uploaded_file):
+    """
+    True if this merge was downloaded and its workspace has been evicted
+    since, so it would otherwise be merged again unasked.
+    """
+    entry = merged.get(uploaded_file.file_id)
+    return (
+        uploaded_file.file_id in downloaded
+        and entry is not None and entry[3] == settings and not os.path.exists(entry[0])
+    )
+
+
+def remember(uploaded_file, merged_path, workspace, stats):
+    old = merged.get(uploaded_file.file_id)
+    if old and old[1] != workspace:
+        workspaces.remove(old[1])
+    merged[uploaded_file.file_id] = (merged_path, workspace, stats, settings)
+    downloaded.discard(uploaded_file.file_id)
+
+
 if uploaded_files:
+    # One slot per ZIP, in upload order, filled as each merge finishes
+    slots = []
     for uploaded_file in uploaded_files:
         st.divider()
         st.subheader(f"Processing: {uploaded_file.name}")
+        slots.append(st.empty())
+
+    # Workspaces shown on this run are never evicted to make room for each
+    # other; downloaded ones may go
+    run_workspaces = [
+        entry[1] for entry in merged.values() if not workspaces.downloaded(entry[1])
+    ]
 
-        try:
-            with st.spinner("Merging PDFs..."):
-                merged_path, temp_dir = merge_pdfs_from_zip(uploaded_file)
+    def new_workspace(uploaded_file):
+        # Sized by the uncompressed PDFs, not the (compressed) upload
+        workspace = workspaces.create(session_id, uncompressed_pdf_bytes(uploaded_file), keep=run_workspaces)
+        run_workspaces.append(workspace)
+        return workspace
 
-            st.success("✅ Merge completed!")
+    todo = []
+    for uploaded_file, slot in zip(uploaded_files, slots):
+        entry = merged_result(uploaded_file)
+        if entry:
+            with slot.container():
+                show_result(uploaded_file, entry[0], workspace=entry[1], stats=entry[2])
+        elif already_downloaded(uploaded_file):
+            with slot.container():
+                st.info("✅ Already downloaded; its merged PDF has been cleared from the server.")
+                again = st.button("🔁 Merge again", key=f"remerge_{uploaded_file.file_id}")
+            if again:
+                todo.append((uploaded_file, slot))
+        else:
+            todo.append((uploaded_file, slot))
 
-            with open(merged_path, "rb") as f:
-                st.download_button(
-                    label=f"⬇ Download {uploaded_file.name.replace('.zip','')}_merged.pdf",
-                    data=f,
-                    file_name=f"{uploaded_file.name.replace('.zip','')}_merged.pdf",
-                    mime="application/pdf"
-                )
+    if workers == 1:
+        for uploaded_file, slot in todo:
+            with slot.container():
+                try:
+                    with st.spinner("Merging PDFs..."):
+                        merged_path, temp_dir, stats = merge_pdfs_from_zip(
+                            uploaded_file, new_workspace(uploaded_file), optimize, image_quality or None
+                        )
+                    remember(uploaded_file, merged_path, temp_dir, stats)
+                    show_result(uploaded_file, merged_path, workspace=temp_dir, stats=stats)
+                except Exception as e:
+                    show_result(uploaded_file, error=e)
+    elif todo:
+        for _, slot in todo:
+            slot.info("⏳ Queued...")
 
-        except Exception as e:
-            st.error(f"❌ {str(e)}")
+        def submit(pool, uploaded_file, out_dir):
+            return pool.submit(
+                merge_zip_bytes, uploaded_file.name, uploaded_file.getvalue(), out_dir, optimize, image_quality or None
+            )
+
+        # At most `workers` ZIPs in flight on the shared pool; the rest wait
+        # here, so other sessions keep their share of it
+        queue = list(todo)
+        futures = {}
+        # Merges lost because a worker died and broke the pool
+        broken = []
+        with st.spinner(f"Merging {len(todo)} ZIPs on {workers} workers..."):
+            while queue or futures:
+                while queue and len(futures) < workers:
+                    uploaded_file, slot = queue.pop(0)
+                    try:
+                        out_dir = new_workspace(uploaded_file)
+                    except Exception as e:
+                        with slot.container():
+                            show_result(uploaded_file, error=e)
+                        continue
+                    pool = get_pool()
+                    try:
+                        futures[submit(pool, uploaded_file, out_dir)] = (uploaded_file, slot, out_dir, pool)
+                    except SUBMIT_ERRORS:
+                        discard_pool(pool)
+                        broken.append((uploaded_file, slot, out_dir))
+                if not futures:
+                    continue
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    uploaded_file, slot, out_dir, pool = futures.pop(future)
+                    # A failing ZIP only reports its own error
+                    with slot.container():
+                        try:
+                            merged_path, temp_dir, stats = future.result()
+                            remember(uploaded_file, merged_path, temp_dir, stats)
+                            show_result(uploaded_file, merged_path, workspace=temp_dir, stats=stats)
+                        except LOST_JOB_ERRORS:
+                            discard_pool(pool)
+                            broken.append((uploaded_file, slot, out_dir))
+                            st.info("🔁 A merge worker crashed, this ZIP will be retried on its own...")
+                        except Exception as e:
+                            show_result(uploaded_file, error=e)
+
+        # Rerun those one at a time on a fresh pool, so only the ZIP that
+        # kills its worker fails
+        for uploaded_file, slot, out_dir in broken:
+            with slot.container():
+                pool = get_pool()
+                try:
+                    with st.spinner("Merging PDFs..."):
+                        try:
+                            future = submit(pool, uploaded_file, out_dir)
+                        except SUBMIT_ERRORS:
+                            discard_pool(pool)
+                            pool = get_pool()
+                            future = submit(pool, uploaded_file, out_dir)
+                        merged_path, temp_dir, stats = future.result()
+                    remember(uploaded_file, merged_path, temp_dir, stats)
+                    show_result(uploaded_file, merged_path, workspace=temp_dir, stats=stats)
+                except LOST_JOB_ERRORS:
+                    discard_pool(pool)
+                    show_result(uploaded_file, error=RuntimeError(
+                        "The merge worker crashed (out of memory?) on this ZIP"
+                    ))
+                except Exception as e:
+                    show_result(uploaded_file, error=e)
+
+used, count = workspaces.usage()
+disk_status.caption(
+    f"💾 Workspace disk: {used / 1024 ** 2:.1f} / {WORKSPACE_QUOTA_MB} MB in {count} workspaces "
+    f"(kept {WORKSPACE_TTL_S // 60} min or until downloaded)"
+)